@@ -1,50 +1,123 @@
+import heapq
 import math
 
-from owlready2 import *
 import os
 import json
-import pandas as pd
-from Levenshtein import distance
+import threading
+import numpy as np
+
+from knowledge_base import KnowledgeBase, file_hash
+from materializer import hermit_fallback, java_executable, run_hermit
+from option_table import OptionTable
+from pareto import ParetoFrontier, skyline
+from quadstore import QuadStore
+from routing import ROUTING_CLASSES, ROUTING_PROPERTIES, Router
+from fuzzy_match import FuzzyIndex
+from instrumentation import Stats, run_profiled, write_stats
+from request_context import RequestContext, SharedLock
+from result_cache import ResultCache
+from scenario_store import ScenarioStore
+
+# Label sets of the fuzzy matching limited to the members of a class, the others are attributes of the knowledge base
+LABEL_CLASSES = {"cuisines": "Cuisine", "neighbourhoods": "Neighbourhood"}
+# Properties the scoring reads the (first) value of, an individual of their domain can not be left without one
+SCORED_PROPERTIES = {"cost", "co2Footprint", "belongsToCity", "hasCuisine"}
+
+
+def fits_datatype(value, datatype):
+    # bool is a subclass of int in Python, but not an integer literal in the ontology
+    if datatype is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, datatype) and (datatype is bool or not isinstance(value, bool))
+
+def round_utilities(values):
+    # np.round works on values * 100 and rounds ties to even, which disagrees with round(x, 2) for floats
+    # such as 0.325 that land on a tie after the multiplication, those few entries are rounded one by one
+    rounded = np.round(values, 2)
+    ties = np.isclose(np.abs(values * 100) % 1, 0.5)
+    rounded[ties] = [round(value, 2) for value in values[ties].tolist()]
+    return rounded
+
+
+def combine_utility(weights, co2_term, cost_term, duration, food):
+    # get_utility on arrays of its terms (broadcast together): the transport CO2 and cost scores, the duration
+    # and the normalized food utility
+    transport_utility = weights["TRANSPORT_CO2"] * co2_term + weights["TRANSPORT_COST"] * cost_term + weights["TRANSPORT_DURATION"] * duration
+    return round_utilities((weights["MAIN_TRANSPORT"] * transport_utility + weights["MAIN_FOOD"] * food) / 100)
+
 
 class Agent:
 
-    def __init__(self, path="infoiag_project_2021_group1.owl"):
-        # Load the desired ontology using the path file
-        self.ontology = get_ontology(path).load()
+    def __init__(self, path="infoiag_project_2021_group1.owl", cache_path=None, result_cache_size=256, result_cache_ttl=None, reasoner="native", quadstore=None, routing="hops"):
+        # reasoner: "native" completes the ontology with the materializer in this process, "hermit" runs HermiT
+        # through owlready2 (needs Java, falls back to the materializer without it)
+        # quadstore: path of an owlready2 SQLite quadstore that keeps the reasoned ontology on disk and selects the
+        # candidates of the requests, None to keep the ontology in memory
+        # routing: "hops" scores the duration with the adjacentTo hops between the neighbourhoods, "transport" with the
+        # travel time of each transport on its shortest route (routing.py)
+        # Timings and counters of the startup and of the runtime updates, every request has its own in its context
+        self.stats = Stats()
+
+        # The compiled knowledge base is cached next to the ontology and reused while the .owl file does not change
+        if cache_path is None:
+            cache_path = os.path.splitext(path)[0] + ".kb.pickle"
+        self.path = path
+        self.reasoner = reasoner
+        self.store = QuadStore(quadstore) if quadstore else None
+        self.ontology = None
+        self.changes = []  # updates applied at runtime, replayed on the ontology if it has to be reasoned again
+        source_hash = file_hash(path)
+        with self.stats.stage("load_cache"):
+            cached = KnowledgeBase.load(cache_path, source_hash) if cache_path else None
+
+        # The cache remembers the reasoner that built it. When HermiT could not run, the materializer built it and it is
+        # trusted while Java does not change, as is any native cache when there is no Java at all. The same goes for
+        # the quadstore, which is rebuilt together with the knowledge base.
+        fallbacks = {hermit_fallback()} | ({"native"} if reasoner == "hermit" and java_executable() is None else set())
+        accepted = lambda built_with: built_with == reasoner or (reasoner == "hermit" and built_with in fallbacks)
+        store_current = True
+        if self.store is not None:
+            with self.stats.stage("open_quadstore"):
+                source = self.store.source()
+            store_current = source is not None and source[0] == source_hash and accepted(source[1])
+        if cached is not None and accepted(cached[1]) and store_current:
+            self.stats.cache("knowledge_base", True)
+            self.kb = cached[0]
+        else:
+            # owlready2 is only needed when the knowledge base has to be rebuilt
+            import owlready2
 
-        # Run the reasoner to obtain the inferences
-        try:
-            owlready2.JAVA_EXE = os.getenv('JAVA_HOME') + "/bin/java.exe"
-            with self.ontology:
-                sync_reasoner(infer_property_values=True)
-        except (FileNotFoundError, TypeError):
-            print("Make sure that you have Java installed and defined in your environment path variables (jdk folder).")
-
-        # Mappings between names (str) and OWL
-        self.label_to_class = {ent._name: ent for ent in self.ontology.classes()}  # "COVID": infoiag_project_2021_group1.COVID
-        self.label_to_prop = {prop._name: prop for prop in self.ontology.properties()}  #  "co2Footprint": infoiag_project_2021_group1.co2Footprint
-        self.label_to_ent = {individual._name: individual for individual in self.ontology.individuals()}  # "bike": infoiag_project_2021_group1.bike
-
-        self.class_to_label = {ent:ent._name for ent in self.ontology.classes()} # infoiag_project_2021_group1.COVID: "COVID"
-        self.prop_to_label = {prop:prop._name for prop in self.ontology.properties()} #  infoiag_project_2021_group1.co2Footprint: "co2Footprint"
-        self.ent_to_label = {individual:individual._name for individual in self.ontology.individuals()}  # infoiag_project_2021_group1.bike: "bike"
-
-        # All the data in OWL representation
-        self.data_dict = {"classes": list(self.ontology.classes()),
-        "data_properties": list(self.ontology.data_properties()),
-        "object_properties": list(self.ontology.object_properties()),
-        "entities": list(self.ontology.individuals())}
-
-        self.weights = { # default values
-            "MAIN_FOOD": 0.5,
-            "MAIN_TRANSPORT": 0.5,
-            "TRANSPORT_CO2": 0.6,
-            "TRANSPORT_COST": 0.3,
-            "TRANSPORT_DURATION": 0.1,
-        }
-        self.restaurants_cheap = []
+            self.stats.cache("knowledge_base", False)
 
-    def set_weights(self, co2, other_preferences, restaurant_crowdedness):
+            # Load the desired ontology using the path file
+            with self.stats.stage("load_ontology"):
+                if self.store is not None:
+                    self.ontology = self.store.load(path, store_current)
+                else:
+                    self.ontology = owlready2.get_ontology(path).load()
+
+            # Compiled snapshot of the reasoned ontology, every lookup in the reasoning goes through it
+            reasoner_used = self.compile(self.ontology)
+            if not store_current:
+                with self.stats.stage("save_quadstore"):
+                    self.stats.count("quadstore_inferred_facts", self.store.save(self.ontology, self.kb, source_hash, reasoner_used))
+            if cache_path:
+                try:
+                    self.kb.save(cache_path, source_hash, reasoner_used)
+                except OSError:
+                    print(f"Could not write the knowledge base cache to {cache_path}")
+
+        # The knowledge base is only read by the requests, runtime updates wait until no request is using it
+        self.kb_lock = SharedLock()
+        with self.stats.stage("build_label_indexes"):
+            self.label_indexes = self.build_label_indexes()
+        self.router = Router(self.kb) if routing == "transport" else None
+        # Results of recent requests, emptied when the version of the knowledge base changes with a runtime update
+        self.version = 0
+        self.result_cache = ResultCache(result_cache_size, result_cache_ttl)
+        self.startup_stats = self.stats.as_dict()
+
+    def set_weights(self, context, co2, other_preferences, restaurant_crowdedness):
         # just a crude heuristic so we can kind of estimate how much the user cares about his food versus his transport, so this is reflected in the utility function weights
         food_points = 1
         t_co2_points = 1
@@ -78,7 +151,7 @@ class Agent:
         else:
             pass
 
-        self.weights = {
+        context.weights = {
             "MAIN_FOOD": food_points / (food_points + t_co2_points + t_cost_points + t_duration_points),
             "MAIN_TRANSPORT": (t_co2_points + t_cost_points + t_duration_points) / (food_points + t_co2_points + t_cost_points + t_duration_points),
             "TRANSPORT_CO2": t_co2_points / (t_co2_points + t_cost_points + t_duration_points),
@@ -86,85 +159,98 @@ class Agent:
             "TRANSPORT_DURATION": t_duration_points / (t_co2_points + t_cost_points + t_duration_points),
         }
 
-    def get_levenshtein_distance(self, word, possible_values):
-        threshold = 3
-        min_distance = 999
-        candidate = None
-        for value in possible_values:
-            dist = distance(word, value)
-            if dist < threshold and dist < min_distance:
-                min_distance = dist
-                candidate = value
-        return candidate
-
-
-    def get_subclasses(self, parent):
-        candidate = self.get_levenshtein_distance(parent, self.label_to_class.keys())
+    def get_levenshtein_distance(self, word, labels="names", context=None):
+        # Closest label at distance < 3 in one of the label sets ("names", "class_names", "cuisines" or "neighbourhoods"). Only
+        # the words that are not a label reach the fuzzy scan, they count in the stats of the request when they are
+        # part of one, in the ones of the agent otherwise
+        stats = self.stats if context is None else context.stats
+        index = self.get_label_index(labels, stats)
+        if word in index.positions:
+            return word
+        stats.count("levenshtein")
+        return index.closest(word)
+
+
+    def build_label_indexes(self):
+        # The fuzzy indexes of the label sets the requests use (cuisines and neighbourhoods), built with the knowledge
+        # base so no request pays for them
+        return {labels: FuzzyIndex([self.kb.names[entity] for entity in self.kb.instances(class_name)]) for labels, class_name in LABEL_CLASSES.items()}
+
+
+    def get_label_index(self, labels, stats):
+        # The indexes of the other label sets (class names for get_subclasses, every name) are only built on their first
+        # lookup. Two calls may build the same one at the same time, both results are equal.
+        index = self.label_indexes.get(labels)
+        if index is None:
+            with stats.stage("build_label_index"):
+                index = FuzzyIndex(getattr(self.kb, labels))
+            self.label_indexes[labels] = index
+        return index
+
+
+    def get_subclasses(self, parent, context=None):
+        candidate = self.get_levenshtein_distance(parent, "class_names", context)
         if candidate is not None:
-            return self.ontology.search(subclass_of = self.label_to_class[candidate])
+            return self.kb.subclasses[candidate]
         print(f"No concept named {parent} found")
         return []
 
 
-    def get_entity_values(self, entity):
-        if type(entity) != str:
-            entity = self.ent_to_label[entity]
-        candidate = self.get_levenshtein_distance(entity, self.label_to_ent.keys())
-        if candidate is not None:
-            result = {}
-            for property in self.label_to_ent[candidate].get_properties():
-                result[self.prop_to_label[property]] = property[self.ontology[candidate]]
-            return result
-        print(f"No entity named {entity} found")
-        return {}
+    def resolve_neighbourhood(self, name, context=None):
+        # Neighbourhood typed by the user, only neighbourhoods match (any other individual would have no location)
+        if name in self.kb.ids and self.kb.is_member(self.kb.ids[name], "Neighbourhood"):
+            return self.kb.ids[name]
+        candidate = self.get_levenshtein_distance(name, "neighbourhoods", context) if isinstance(name, str) else None
+        if candidate is None:
+            raise ValueError(f"No neighbourhood named {name} found")
+        return self.kb.ids[candidate]
 
 
-    def get_utility(self, transport, meal, restaurant_neighbourhood, user_neighbourhood):
-        return round((self.weights["MAIN_TRANSPORT"] * self.get_transport_utility(transport, restaurant_neighbourhood, user_neighbourhood) + \
-        self.weights["MAIN_FOOD"] * self.get_food_utility(meal, restaurant_neighbourhood, normalized=True))/100, 2)
+    def resolve_cuisines(self, cuisines, context=None):
+        # Cuisine names typed by the user, the ones too far from every cuisine are kept as they are (they match nothing)
+        result = []
+        for cuisine in cuisines:
+            candidate = self.get_levenshtein_distance(cuisine, "cuisines", context)
+            result.append(cuisine if candidate is None else candidate)
+        return result
 
 
-    def get_transport_utility(self, transport, restaurant_neighbourhood, user_neighbourhood):
-        properties = self.get_entity_values(transport)
-        try:
-            result = self.weights["TRANSPORT_CO2"] * abs(properties["co2Footprint"][0] - 100) + \
-            self.weights["TRANSPORT_COST"] * abs(properties["cost"][0] - 100) + \
-            self.weights["TRANSPORT_DURATION"] * self.get_duration(restaurant_neighbourhood, user_neighbourhood)  # abs(properties["duration"][0] - 100)
-            return result
-        except KeyError:
-            print("Error when processing the transport utility")
-            return 0
+    # get_utility, get_transport_utility and calculate_co2 score one option, score_options scores the whole grid at once.
+    # They are the reference verify_scores checks score_options against, so they raise instead of scoring 0.
+
+    def get_utility(self, context, transport, meal, restaurant_neighbourhood, user_neighbourhood):
+        return round((context.weights["MAIN_TRANSPORT"] * self.get_transport_utility(context, transport, restaurant_neighbourhood, user_neighbourhood) + \
+        context.weights["MAIN_FOOD"] * self.get_food_utility(meal, restaurant_neighbourhood, normalized=True))/100, 2)
+
+
+    def get_transport_utility(self, context, transport, restaurant_neighbourhood, user_neighbourhood):
+        transport = self.kb.ids[transport]
+        result = context.weights["TRANSPORT_CO2"] * abs(self.kb.first(transport, "co2Footprint") - 100) + \
+        context.weights["TRANSPORT_COST"] * abs(self.kb.first(transport, "cost") - 100) + \
+        context.weights["TRANSPORT_DURATION"] * self.get_duration(restaurant_neighbourhood, user_neighbourhood, transport)
+        return result
+
 
+    def get_duration(self, restaurant_neighbourhood, user_neighbourhood, transport=None):
+        # With routing, the travel time of the transport scored like its other properties: 100 - time, 0 from a time
+        # of 100 on or without a route
+        if self.router is not None and transport is not None:
+            time = self.router.travel_times(user_neighbourhood, transport).get(restaurant_neighbourhood)
+            return 0 if time is None else max(100 - time, 0)
 
-    def get_duration(self, restaurant_neighbourhood, user_neighbourhood):
         duration = 0
         cost_travel_neighbourhood = 10
         cost_travel_city = 80
 
-        properties_restaurant_neighbourhood = self.get_entity_values(restaurant_neighbourhood)
-        properties_user_neighbourhood = self.get_entity_values(user_neighbourhood)
+        city_restaurant = self.kb.first(restaurant_neighbourhood, "belongsToCity")
+        city_user = self.kb.first(user_neighbourhood, "belongsToCity")
 
-        city_restaurant = self.ent_to_label[properties_restaurant_neighbourhood["belongsToCity"][0]]
-        city_user = self.ent_to_label[properties_user_neighbourhood["belongsToCity"][0]]
-
-        if city_restaurant == city_user:
-            adjacents = [self.ent_to_label[x] for x in properties_restaurant_neighbourhood["adjacentTo"]]
-            if user_neighbourhood in adjacents:
-                duration += cost_travel_neighbourhood
-            elif user_neighbourhood == self.ent_to_label[restaurant_neighbourhood]:
-                pass
-            else:
-                while user_neighbourhood not in adjacents:
-                    duration += cost_travel_neighbourhood
-                    updated_adjacents = []
-                    for neigh in adjacents:
-                        properties_neigh = self.get_entity_values(neigh)
-                        for adj_neigh in properties_neigh["adjacentTo"]:
-                            updated_adjacents.append(adj_neigh)
-                    adjacents = [self.ent_to_label[x] for x in updated_adjacents]
-                    if len(adjacents) == 0: break
-        else:
+        hops = self.kb.neighbourhood_distance(restaurant_neighbourhood, user_neighbourhood)
+        if city_restaurant != city_user or hops is None:
             duration += cost_travel_city
+        elif hops > 0:
+            # Adjacent neighbourhoods cost one step, otherwise every intermediate neighbourhood costs one
+            duration += cost_travel_neighbourhood * max(hops - 1, 1)
 
         return duration
 
@@ -172,51 +258,102 @@ class Agent:
     def get_food_utility(self, meal, neighbourhood, normalized=False):
         try:
             result = 0
-            meal = self.get_entity_values(meal)
-            for food in meal["hasFood"]:
+            foods = self.kb.get(meal, "hasFood")
+            for food in foods:
                 result += self.check_food_co2_discount(food, neighbourhood)
-            if normalized: return result / len(meal["hasFood"])
+            if normalized: return result / len(foods)
             return result
-        except KeyError:
+        except (KeyError, ZeroDivisionError):
             print("Error when processing the food utility")
             return 0
 
 
     def check_food_co2_discount(self, food, neighbourhood):
-        properties_food = self.get_entity_values(food)
-        properties_neighbourhood = self.get_entity_values(neighbourhood)
-        city = properties_neighbourhood["belongsToCity"][0]
+        city = self.kb.first(neighbourhood, "belongsToCity")
         try:
-            result = abs(properties_food["co2Footprint"][0] - 100)
-            if properties_food["producedIn"][0] == self.get_entity_values(city)["locatedAt"]:
+            result = abs(self.kb.first(food, "co2Footprint") - 100)
+            if self.kb.first(food, "producedIn") == self.kb.get(city, "locatedAt"):
                 result = result * 0.25
             return result
-        except KeyError:
+        except (KeyError, IndexError):
             print("Error when processing the food CO2 discount")
             return 0
 
 
-    def generate_output(self, options):
+    def generate_output(self, options, path="output.json"):
+        # options are already sorted by utility, so the keys follow the ranking. The file is written to a temporary
+        # file first, so a process reading it never sees the half written output of another one
         result = {}
         for i, option in enumerate(options, start=1):
             result[f"option{i}"] = {"transport": option["transport"], "city": option["city"], "neighbourhood": option["neighbourhood"], "restaurant": option["restaurant"],
             "meal": option["meal"], "co2": option["co2"], "utility": option["utility"]}
-        sorted_tuples = sorted(result.items(), key=lambda x: x[1]["utility"], reverse=True)
-        sorted_result = {k: v for k, v in sorted_tuples}
-        with open("output.json", "w") as f:
-            json.dump(sorted_result, f, indent=4)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(result, f, indent=4)
+        os.replace(tmp_path, path)
 
 
     def calculate_co2(self, transport, meal, location):
         total_co2 = 0
-        properties_transport = self.get_entity_values(transport)
-        try:
-            total_co2 += properties_transport["co2Footprint"][0]
-            total_co2 += self.get_food_utility(meal, location)
-            return total_co2
-        except KeyError:
-            print("Error when processing the total CO2 consumption")
-            return 0
+        total_co2 += self.kb.first(self.kb.ids[transport], "co2Footprint")
+        total_co2 += self.get_food_utility(meal, location)
+        return total_co2
+
+
+    def score_options(self, context, transports, candidates, user_neighbourhood):
+        # Same values as calculate_co2 and get_utility for the whole transport x (restaurant, neighbourhood, meal) grid.
+        # The food terms only depend on the meal and the city, the duration on the neighbourhood, so they are computed
+        # once (the context keeps them between calls of the same request) and combined with the transport vectors by broadcasting.
+        if len(transports) == 0 or len(candidates) == 0:
+            return np.zeros((len(transports), len(candidates))), np.zeros((len(transports), len(candidates)))
+        transport_co2, transport_cost, candidate_food, candidate_food_normalized, candidate_duration = \
+            self.score_terms(context, transports, candidates, user_neighbourhood)
+
+        utility = combine_utility(context.weights, np.abs(transport_co2 - 100)[:, None], np.abs(transport_cost - 100)[:, None],
+            candidate_duration, candidate_food_normalized[None, :])
+        co2 = transport_co2[:, None] + candidate_food[None, :]
+
+        return co2, utility
+
+
+    def get_durations(self, transport_ids, restaurant_neighbourhood, user_neighbourhood):
+        # Duration of each transport, a single value for all of them without routing
+        if self.router is None:
+            return np.array([self.get_duration(restaurant_neighbourhood, user_neighbourhood)])
+        return np.array([self.get_duration(restaurant_neighbourhood, user_neighbourhood, transport) for transport in transport_ids])
+
+
+    def score_terms(self, context, transports, candidates, user_neighbourhood):
+        # (CO2 footprint and cost of each transport, total and normalized food utility of each candidate, and the
+        # (transports, candidates) durations, a single row shared by the transports without routing)
+        cache = context.score_cache
+
+        transport_ids = [self.kb.ids[transport] for transport in transports]
+        transport_co2 = np.array([self.kb.first(transport, "co2Footprint") for transport in transport_ids])
+        transport_cost = np.array([self.kb.first(transport, "cost") for transport in transport_ids])
+
+        food_totals = cache.setdefault("food_totals", {})
+        food_normalized = cache.setdefault("food_normalized", {})
+        durations = cache.setdefault("durations", {})
+        candidate_food = []
+        candidate_food_normalized = []
+        candidate_duration = []
+        for _, neighbourhood, meal in candidates:
+            key = (meal, self.kb.neighbourhood_city.get(neighbourhood, neighbourhood))
+            if key not in food_totals:
+                food_totals[key] = self.get_food_utility(meal, neighbourhood)
+                food_normalized[key] = self.get_food_utility(meal, neighbourhood, normalized=True)
+            if neighbourhood not in durations:
+                durations[neighbourhood] = self.get_durations(transport_ids, neighbourhood, user_neighbourhood)
+            candidate_food.append(food_totals[key])
+            candidate_food_normalized.append(food_normalized[key])
+            candidate_duration.append(durations[neighbourhood])
+
+        candidate_food = np.array(candidate_food)
+        candidate_food_normalized = np.array(candidate_food_normalized)
+        candidate_duration = np.array(candidate_duration).T
+
+        return transport_co2, transport_cost, candidate_food, candidate_food_normalized, candidate_duration
 
 
     def get_transports(self, locations, preferences_CO2, other_preferences, available_transports, health_conditions, neighbourhood):
@@ -250,82 +387,80 @@ class Agent:
         rideShares = []
         for location in locations:
             key = next(iter(location))
-            if self.ent_to_label[location[key]["neighbourhood"]] == neighbourhood and "rideShare" in available_transports:
+            if location[key]["neighbourhood"] == neighbourhood and "rideShare" in available_transports:
                 rideShares.append(neighbourhood)
 
         return available_transports, rideShares
 
 
-    def get_restaurants(self, preferred_cuisines, avoid_cuisines, health_conditions, preferences_CO2, restaurant_crowdedness, other_preferences):
+    def get_restaurants(self, context, preferred_cuisines, avoid_cuisines, health_conditions, preferences_CO2, restaurant_crowdedness, other_preferences):
         result = []
 
-        restaurants = self.ontology.search(type = self.label_to_class["Restaurant"])
-
-        restaurants_price_high_to_low = []
-        restaurants_sort = restaurants
-        counter = 0
-        while True: # dont judge me please, we have all sinned
-            current_restaurant = restaurants_sort[counter]
-            while len(current_restaurant.isCheaperThan) > 0 and current_restaurant.isCheaperThan[0] not in restaurants_price_high_to_low:
-                current_restaurant = current_restaurant.isCheaperThan[0]
-
-            if current_restaurant not in restaurants_price_high_to_low:
-                restaurants_price_high_to_low.append(current_restaurant)
-            counter += 1
-            counter = counter % len(restaurants_sort)
-            if len(restaurants_price_high_to_low) == len(restaurants): break
-        restaurants_price_high_to_low.reverse()
-        self.restaurants_cheap = restaurants_price_high_to_low
-
-        preferred_restaurants = []
-        for restaurant in restaurants:
-            properties = self.get_entity_values(restaurant)
-            cuisine = self.ent_to_label[properties["hasCuisine"][0]]
-            if cuisine in preferred_cuisines:
-                preferred_restaurants.append(restaurant)
+        for restaurant, filtered in self.iter_restaurants(context, preferred_cuisines, avoid_cuisines, health_conditions, preferences_CO2, restaurant_crowdedness):
+            cuisine = self.kb.entity_values(self.kb.first(restaurant, "hasCuisine"))
+            option = {f"{self.kb.names[restaurant]}": {"cuisine": cuisine, "neighbourhood": self.kb.get(restaurant, "hasEstablishmentAt"), "meals": filtered}}
+            result.append(option)
+
+        return result
+
 
-        if len(preferred_restaurants) > 0:
-            restaurants = preferred_restaurants
+    def iter_restaurants(self, context, preferred_cuisines, avoid_cuisines, health_conditions, preferences_CO2, restaurant_crowdedness):
+        # Yields (restaurant, eligible meals) for the restaurants that pass the filters, in catalog order
+        # The quadstore holds the facts of the .owl file, it selects the candidates until the first runtime update
+        if self.store is not None and len(self.changes) == 0:
+            yield from self.iter_store_restaurants(context, preferred_cuisines, avoid_cuisines, health_conditions, preferences_CO2, restaurant_crowdedness)
+            return
+
+        # Candidates come from the cuisine index, the whole catalog is only used when no preferred cuisine matches
+        restaurants = self.kb.restaurants_with_cuisines(preferred_cuisines)
+        if len(restaurants) == 0:
+            restaurants = self.kb.instances("Restaurant")
 
         for restaurant in restaurants:
-            properties = self.get_entity_values(restaurant)
-            filtered = self.apply_restaurant_filters(properties, avoid_cuisines, health_conditions, preferences_CO2, restaurant_crowdedness)
+            with context.stats.stage("apply_restaurant_filters"):
+                filtered = self.apply_restaurant_filters(context, restaurant, avoid_cuisines, health_conditions, preferences_CO2, restaurant_crowdedness)
             if len(filtered) > 0:
-                cuisine = self.get_entity_values(properties["hasCuisine"][0])
-                option = {f"{self.ent_to_label[restaurant]}": {"cuisine": cuisine, "neighbourhood": properties["hasEstablishmentAt"], "meals": filtered}}
-                result.append(option)
+                yield restaurant, filtered
 
-        return result
 
+    def iter_store_restaurants(self, context, preferred_cuisines, avoid_cuisines, health_conditions, preferences_CO2, restaurant_crowdedness):
+        # Same candidates as apply_restaurant_filters over the knowledge base, selected by SPARQL queries
+        low_co2_food = "lowCO2Food" in preferences_CO2 or "lowCO2All" in preferences_CO2
+        with context.stats.stage("quadstore_query"):
+            cuisines = preferred_cuisines if self.store.has_restaurants(preferred_cuisines) else []
+            candidates = self.store.candidates(cuisines, avoid_cuisines, self.excluded_crowdedness(restaurant_crowdedness), health_conditions, low_co2_food)
+
+        for restaurant in sorted(self.kb.ids[name] for name in candidates if name in self.kb.ids):
+            eligible = candidates[self.kb.names[restaurant]]
+            meals = [meal for meal in self.kb.get(self.kb.first(restaurant, "hasCuisine"), "servesMeals") if self.kb.names[meal] in eligible]
+            if len(meals) > 0:
+                yield restaurant, meals
 
-    def apply_restaurant_filters(self, restaurant, avoid_cuisines, health_conditions, preferences_CO2, restaurant_crowdedness):
-        ok_meals = []
 
-        cuisine = self.get_entity_values(restaurant["hasCuisine"][0])
-        crowdedness = self.get_entity_values(restaurant["hasCrowdedness"][0])
+    def excluded_crowdedness(self, restaurant_crowdedness):
+        # Crowdedness values of the restaurants left out: the crowded ones for "low" and the quiet ones for "high"
+        if "low" in restaurant_crowdedness:
+            return ["highCrowdedness"]
+        if "high" in restaurant_crowdedness:
+            return ["lowCrowdedness"]
+        return []
+
 
-        if restaurant_crowdedness != "none":
-            if restaurant_crowdedness == "low" and crowdedness == "highCrowdedness":
-                return ok_meals
-            elif restaurant_crowdedness == "high" and crowdedness == "lowCrowdedness":
-                return ok_meals
+    def apply_restaurant_filters(self, context, restaurant, avoid_cuisines, health_conditions, preferences_CO2, restaurant_crowdedness):
+        # Restaurants with an excluded crowdedness or with one of the avoided cuisines have no eligible meals, the same
+        # filters as the SPARQL queries of the quadstore
+        ok_meals = []
+
+        cuisine = self.kb.first(restaurant, "hasCuisine")
+        excluded = self.excluded_crowdedness(restaurant_crowdedness)
+        if any(self.kb.names[crowdedness] in excluded for crowdedness in self.kb.get(restaurant, "hasCrowdedness")):
+            return ok_meals
 
-        if cuisine in avoid_cuisines:
+        if any(self.kb.names[other] in avoid_cuisines for other in self.kb.get(restaurant, "hasCuisine")):
             return ok_meals
 
-        for meal in cuisine["servesMeals"]:
-            meal_properties = self.get_entity_values(meal)
-            check_food = True
-            for food in meal_properties["hasFood"]:
-                food_properties = self.get_entity_values(food)
-                for nutrient in food_properties["hasNutrients"]:
-                    nutrient = self.ent_to_label[nutrient]
-                    if nutrient in health_conditions:
-                        check_food = False
-                if ("lowCO2Food" in preferences_CO2 or "lowCO2All" in preferences_CO2) and food_properties["co2Footprint"][0] > 50:
-                    check_food = False
-            if check_food:
-                ok_meals.append(meal)
+        low_co2_food = "lowCO2Food" in preferences_CO2 or "lowCO2All" in preferences_CO2
+        ok_meals = list(self.kb.eligible_meals(cuisine, self.kb.profile_mask(health_conditions, low_co2_food), context.stats))
 
         return ok_meals
 
@@ -333,18 +468,13 @@ class Agent:
     def get_restaurants_location(self, restaurants):
         result = []
 
-        neighbourhoods = self.ontology.search(type = self.label_to_class["Neighbourhood"])
-
         for restaurant in restaurants:
             key = next(iter(restaurant))
             restaurant_neigbourhood = restaurant[key]["neighbourhood"][0]
-            for neighbourhood in neighbourhoods:
-                if self.ent_to_label[restaurant_neigbourhood] == self.ent_to_label[neighbourhood]:
-                    properties_neighbourhood = self.get_entity_values(neighbourhood)
-                    city = properties_neighbourhood["belongsToCity"][0]
-                    city_properties = self.get_entity_values(city)
-                    option = {f"{key}": {"neighbourhood": restaurant_neigbourhood, "city": city, "location": city_properties["locatedAt"]}}
-                    result.append(option)
+            if restaurant_neigbourhood in self.kb.neighbourhood_city:
+                city = self.kb.neighbourhood_city[restaurant_neigbourhood]
+                option = {f"{key}": {"neighbourhood": restaurant_neigbourhood, "city": city, "location": self.kb.city_location[city]}}
+                result.append(option)
 
         return result
 
@@ -367,68 +497,469 @@ class Agent:
         return str_list.strip("[]").replace("'", "").split(",")
 
 
-    def reasoning(self, scenario_number):
-        df = pd.read_json("scenarios.json")
+    def add_individual(self, name, class_name, values=None):
+        # Runtime updates of the knowledge base: values are {property: value or list of values}, with the names of
+        # the individuals for object properties. Only the affected indexes are refreshed, and the reasoner only runs
+        # again when a property used by a definition it has to infer (e.g. BigCity) changes.
+        with self.kb_lock.writing(), self.stats.stage("apply_update"):
+            if name in self.kb.ids:
+                raise ValueError(f"There is already an individual named {name}")
+            if class_name not in self.kb.members:
+                raise ValueError(f"No concept named {class_name}")
+            classes = set(self.kb.superclasses(class_name))
+            values = self.normalize_values(values or {}, classes=classes)
+            missing = sorted(prop for prop in SCORED_PROPERTIES if set(self.kb.domains.get(prop, ())) & classes and prop not in values)
+            if missing:
+                raise ValueError(f"A {class_name} needs a value for {', '.join(missing)}")
+            entity = self.kb.add_individual(name, class_name)
+            for labels, index in self.label_indexes.items():
+                if labels in LABEL_CLASSES and self.kb.is_member(entity, LABEL_CLASSES[labels]):
+                    index.add(name)
+            self.apply_update(("add", name, class_name, values), entity, values, classes)
+        return entity
+
+
+    def update_individual(self, name, values, append=False):
+        # Replaces the given properties (or adds to them with append=True), e.g. {"hasCrowdedness": "highCrowdedness"}
+        with self.kb_lock.writing(), self.stats.stage("apply_update"):
+            if name not in self.kb.ids:
+                raise ValueError(f"No entity named {name} found")
+            entity = self.kb.ids[name]
+            # The log replayed by reason_again only gets the asserted values, the knowledge base keeps the inferred ones too
+            classes = {class_name for class_name in self.kb.members if self.kb.is_member(entity, class_name)}
+            asserted = self.normalize_values(values, self.kb.asserted_values(entity) if append else None, classes)
+            values = self.normalize_values(values, self.kb.entity_values(entity, closure=False) if append else None, classes)
+            self.apply_update(("update", name, None, asserted), entity, values)
+
+
+    def remove_individual(self, name):
+        with self.kb_lock.writing(), self.stats.stage("apply_update"):
+            if name not in self.kb.ids:
+                raise ValueError(f"No entity named {name} found")
+            touched, props, classes = self.kb.remove_individual(self.kb.ids[name])
+            for index in self.label_indexes.values():
+                index.discard(name)
+            self.changes.append(("remove", name, None, {}))
+            self.refresh(touched, props, classes)
+
+
+    def normalize_values(self, values, current=None, classes=()):
+        # {property: [values]} with the names checked, current values are kept in front when appending. The values
+        # are checked against the schema of the properties for an individual of the classes, a ValueError is raised
+        # before the knowledge base changes
+        result = {}
+        for prop, prop_values in values.items():
+            if prop not in self.kb.offsets:
+                raise ValueError(f"No property named {prop}")
+            prop_values = list(prop_values) if isinstance(prop_values, (list, tuple)) else [prop_values]
+            domain = self.kb.domains.get(prop, [])
+            if domain and not set(domain) & set(classes):
+                raise ValueError(f"{prop} only applies to individuals of {', '.join(domain)}")
+            if prop in self.kb.object_properties:
+                missing = [value for value in prop_values if value not in self.kb.ids]
+                if missing:
+                    raise ValueError(f"No entities named {missing} found")
+                ranges = self.kb.ranges.get(prop, [])
+                outside = [value for value in prop_values if ranges and not any(self.kb.is_member(self.kb.ids[value], cls) for cls in ranges)]
+                if outside:
+                    raise ValueError(f"The values of {prop} must be individuals of {', '.join(ranges)}, not {outside}")
+            else:
+                datatypes = self.kb.datatypes.get(prop, ())
+                wrong = [value for value in prop_values if datatypes and not any(fits_datatype(value, datatype) for datatype in datatypes)]
+                if wrong:
+                    raise ValueError(f"The values of {prop} must be of type {' or '.join(datatype.__name__ for datatype in datatypes)}, not {wrong}")
+            if current is not None:
+                prop_values = [value for value in current.get(prop, []) if value not in prop_values] + prop_values
+            if len(prop_values) == 0 and prop in SCORED_PROPERTIES:
+                raise ValueError(f"{prop} can not be left without a value, the scores read it")
+            if len(prop_values) > 1 and prop in self.kb.functional_properties:
+                raise ValueError(f"{prop} can only have one value")
+            result[prop] = prop_values
+        return result
 
-        df = df.iloc[scenario_number]
 
-        options = []
+    def apply_update(self, change, entity, values, classes=frozenset()):
+        # values: the new values in the knowledge base, the change has the asserted ones
+        self.changes.append(change)
+        asserted = change[3]
+        touched = {entity}
+        for prop, prop_values in values.items():
+            asserted_ids = None
+            if prop in self.kb.object_properties:
+                prop_values = [self.kb.ids[value] for value in prop_values]
+                asserted_ids = [self.kb.ids[value] for value in asserted[prop]]
+            touched |= self.kb.update(entity, prop, prop_values, asserted_ids)
+        props = set(values) | {self.kb.inverses[prop] for prop in values if prop in self.kb.inverses}
+        self.refresh(touched, props, classes)
+
+
+    def refresh(self, touched, props, classes):
+        self.version += 1
+        self.stats.count("updated_entities", len(touched))
+        reasoned = len(props & self.kb.reasoned_properties) > 0
+        if reasoned:
+            # The knowledge base is compiled again, refreshing its indexes first would be wasted
+            self.reason_again()
+        else:
+            classes = set(classes) | self.kb.reclassify(touched)
+            self.kb.refresh(props, classes, touched)
+        if self.router is not None and (reasoned or props & ROUTING_PROPERTIES or set(classes) & ROUTING_CLASSES):
+            # The graph is rebuilt from the updated (or new) knowledge base and the cached travel times are dropped,
+            # other changes keep them
+            self.router = Router(self.kb)
+
+
+    def reason_again(self):
+        # Loads the ontology in a new world, replays every runtime update and runs the reasoner on it
+        import owlready2
+
+        with self.stats.stage("load_ontology"):
+            world = owlready2.World()
+            ontology = world.get_ontology(self.path).load()
+        for action, name, class_name, values in self.changes:
+            if action == "remove":
+                owlready2.destroy_entity(ontology[name])
+                continue
+            individual = ontology[class_name](name) if action == "add" else ontology[name]
+            for prop, prop_values in values.items():
+                if prop in self.kb.object_properties:
+                    prop_values = [ontology[value] for value in prop_values]
+                ontology[prop][individual] = prop_values
+        self.compile(ontology)
+        self.ontology = ontology
+        self.label_indexes = self.build_label_indexes()
+
+
+    def compile(self, ontology):
+        # Runs the reasoner on the ontology and compiles the result into self.kb, returns the reasoner that was used
+        import owlready2
+
+        if self.reasoner == "hermit":
+            try:
+                with self.stats.stage("sync_reasoner"):
+                    run_hermit(ontology.world)
+                with self.stats.stage("compile_knowledge_base"):
+                    self.kb = KnowledgeBase.from_ontology(ontology)
+                return "hermit"
+            except (OSError, owlready2.OwlReadyJavaError):
+                print("Make sure that you have Java installed and defined in your environment path variables (jdk folder).")
+                print("Using the native materializer instead of HermiT")
+                with self.stats.stage("compile_knowledge_base"):
+                    self.kb = KnowledgeBase.from_ontology(ontology, materialize=True, stats=self.stats)
+                return hermit_fallback()
+
+        with self.stats.stage("compile_knowledge_base"):
+            self.kb = KnowledgeBase.from_ontology(ontology, materialize=True, stats=self.stats)
+        return "native"
+
+
+    def reasoning(self, scenario_number, top_k=None, profile_path=None):
+        # profile_path: a .prof file gets a cProfile dump of the recommendation, any other file the JSON stats
+        with ScenarioStore() as store:
+            df = store.get(scenario_number)
+
+        context = RequestContext()
+        try:
+            cprofile_path = profile_path if profile_path is not None and profile_path.endswith(".prof") else None
+            options = run_profiled(cprofile_path, self.recommend, df, verbose=True, top_k=top_k, context=context)
+        except ValueError as e:
+            print(e)
+            return
+
+        if profile_path is not None and cprofile_path is None:
+            write_stats(profile_path, {"startup": self.startup_stats, "request": context.stats.as_dict()})
+
+        self.generate_output(options, context.output_path)
+        self.display_options(context, options)
+
+
+    def recommend(self, df, verbose=False, top_k=None, lazy=False, context=None):
+        # df is a single scenario, a dict with the keys filled in the form (see scenario_store).
+        # Returns the options sorted by utility, only the best top_k if given, as an iterator if lazy.
+        # Safe to call from several threads: the weights, timings, counters and options of the request are left
+        # in context (a new one if not given) and the knowledge base is only read. A lazy iterator builds the
+        # options from the scores when they are pulled, after the knowledge base has been released.
+        if context is None:
+            context = RequestContext()
+        with self.kb_lock.reading():
+            options = self.find_options(context, df, verbose, top_k, lazy)
+        if not lazy:
+            context.options = options
+        return options
+
+
+    def find_options(self, context, df, verbose, top_k, lazy):
+        preferences = self.process_request(context, df, verbose)
+
+        # Same processed preferences give the same options while the knowledge base does not change
+        key = self.request_key(preferences) + (top_k,)
+        options = self.result_cache.get(key, self.version)
+        context.stats.cache("results", options is not None)
+        if options is None:
+            options = self.compute_options(context, top_k, *preferences)
+            self.result_cache.put(key, self.version, options)
+        return iter(options) if lazy else options
+
+
+    def process_request(self, context, df, verbose):
+        # Preferences of a row of the form as (health_conditions, transport_preferences, preferred_cuisines, avoid_cuisines,
+        # low_co2, other_preferences, restaurant_crowdedness, user_neighbourhood), the weights are set in the context
+        context.score_cache = {}
 
         # Preference preprocessing
         health_conditions = self.process_preferences([df["condition_muscle_ache"], df["condition_covid"], df["condition_gluten"], df["condition_lactose"]], ["muscleAche", "covid", "gluten", "lactose"])
         transport_preferences = self.process_preferences([df["pref_transport_bike"], df["pref_transport_electric_car"], df["pref_transport_gas_car"], df["pref_transport_rideshare"], df["pref_transport_train"], df["pref_transport_walk"]], ["bike", "electricCar", "gasolineCar", "rideShare", "train", "walking"])
-        preferred_cuisines = self.process_input_lists(df["cuisine_food_pref"])
-        avoid_cuisines = self.process_input_lists(df["cuisine_food_avoid"])
+        preferred_cuisines = self.resolve_cuisines(self.process_input_lists(df["cuisine_food_pref"]), context)
+        avoid_cuisines = self.resolve_cuisines(self.process_input_lists(df["cuisine_food_avoid"]), context)
         low_co2 = self.process_preferences([df["pref_co2_low_food"], df["pref_co2_low_food_and_transport"], df["pref_co2_low_transport"]], ["lowCO2Food", "lowCO2All", "lowCO2Transport"])
         other_preferences = self.process_preferences([df["pref_transport_fast"], df["pref_transport_cheap"], df["restaurant_price_range"]], ["trans_fast", "trans_cheap"])
         restaurant_crowdedness = self.process_preferences([df["pref_crowdedness_none"], df["pref_crowdedness_low"], df["pref_crowdedness_high"]], ["none", "low", "high"])
 
-        print("\n** EXTRACTED USER PREFERENCES **\n")
-        print(f"Health conditions:\n\t{health_conditions}")
-        print(f"Available transports:\n\t{transport_preferences}")
-        print(f"Preferred cuisines:\n\t{preferred_cuisines}")
-        print(f"Cuisines to avoid:\n\t{avoid_cuisines}")
-        print(f"Low CO2 requirements:\n\t{low_co2}")
-        print(f"Crowdedness preferences:\n\t{restaurant_crowdedness}")
-        print(f"Other preferences:\n\t{other_preferences}")
+        if verbose:
+            print("\n** EXTRACTED USER PREFERENCES **\n")
+            print(f"Health conditions:\n\t{health_conditions}")
+            print(f"Available transports:\n\t{transport_preferences}")
+            print(f"Preferred cuisines:\n\t{preferred_cuisines}")
+            print(f"Cuisines to avoid:\n\t{avoid_cuisines}")
+            print(f"Low CO2 requirements:\n\t{low_co2}")
+            print(f"Crowdedness preferences:\n\t{restaurant_crowdedness}")
+            print(f"Other preferences:\n\t{other_preferences}")
 
-        self.set_weights(low_co2, other_preferences, restaurant_crowdedness)
+        self.set_weights(context, low_co2, other_preferences, restaurant_crowdedness)
 
-        # Preference matching
-        restaurants = self.get_restaurants(preferred_cuisines, avoid_cuisines, health_conditions, low_co2, restaurant_crowdedness, other_preferences)
-        locations = self.get_restaurants_location(restaurants)
-        available_transports, ride_shares = self.get_transports(locations, low_co2, other_preferences, transport_preferences, health_conditions, df["select_neighbourhood"])
+        user_neighbourhood = self.resolve_neighbourhood(df["select_neighbourhood"], context)
 
-        # Options' extraction given the results
-        ride_share_counter = 0
-        for transport in available_transports:
-            for restaurant in restaurants:
-                key = next(iter(restaurant))
-                restaurant_neighbourhoods = restaurant[key]["neighbourhood"]
-                for neighbourhood in restaurant_neighbourhoods:
-                    if transport == "rideShare" and len(ride_shares) > 0 and ride_shares[ride_share_counter] == self.ent_to_label(neighbourhood):
-                        transport = "rideShare"
-                    for meal in restaurant[key]["meals"]:
-                        co2 = self.calculate_co2(transport, meal, neighbourhood)
-                        utility = self.get_utility(transport, meal, neighbourhood, df["select_neighbourhood"])
+        return health_conditions, transport_preferences, preferred_cuisines, avoid_cuisines, low_co2, other_preferences, restaurant_crowdedness, \
+            user_neighbourhood
+
+
+    def request_key(self, preferences):
+        # The lists of transports, health conditions, CO2 and other preferences always come in the same order, cuisines are sets
+        health_conditions, transport_preferences, preferred_cuisines, avoid_cuisines, low_co2, other_preferences, restaurant_crowdedness, \
+            user_neighbourhood = preferences
+        return (tuple(health_conditions), tuple(transport_preferences), tuple(sorted(set(preferred_cuisines))), tuple(sorted(set(avoid_cuisines))),
+            tuple(low_co2), tuple(other_preferences), tuple(restaurant_crowdedness), user_neighbourhood)
+
+
+    def compute_options(self, context, top_k, health_conditions, transport_preferences, preferred_cuisines, avoid_cuisines, low_co2,
+        other_preferences, restaurant_crowdedness, user_neighbourhood):
+        if top_k is not None:
+            # Transports are pruned first, then restaurants are filtered as they are pulled and scored by
+            # decreasing utility upper bound until the top_k cannot change anymore
+            with context.stats.stage("get_transports"):
+                available_transports, _ = self.get_transports([], low_co2, other_preferences, transport_preferences, health_conditions, user_neighbourhood)
+            restaurants = self.iter_restaurants(context, preferred_cuisines, avoid_cuisines, health_conditions, low_co2, restaurant_crowdedness)
+            with context.stats.stage("stream_top_options"):
+                return self.stream_top_options(context, available_transports, restaurants, user_neighbourhood, top_k)
 
-                        option = {"transport": transport, "restaurant": key,
-                            "city": self.ent_to_label[self.get_entity_values(neighbourhood)["belongsToCity"][0]], "neighbourhood": self.ent_to_label[neighbourhood], "meal": self.ent_to_label[meal], "co2": co2, "utility": utility}
+        available_transports, candidates = self.option_grid(context, health_conditions, transport_preferences, preferred_cuisines, avoid_cuisines,
+            low_co2, other_preferences, restaurant_crowdedness, user_neighbourhood)
 
-                        options.append(option)
+        with context.stats.stage("score_options"):
+            co2, utility = self.score_options(context, available_transports, candidates, user_neighbourhood)
 
-        self.generate_output(options)
-        self.display_options()
+        with context.stats.stage("rank_options"):
+            return self.rank_options(available_transports, candidates, co2, utility, top_k)
 
 
-    def display_options(self):
+    def option_grid(self, context, health_conditions, transport_preferences, preferred_cuisines, avoid_cuisines, low_co2,
+        other_preferences, restaurant_crowdedness, user_neighbourhood):
+        # Available transports and the (restaurant, neighbourhood, meal) candidates, every option is a pair of both
+        # Preference matching
+        with context.stats.stage("get_restaurants"):
+            restaurants = self.get_restaurants(context, preferred_cuisines, avoid_cuisines, health_conditions, low_co2, restaurant_crowdedness, other_preferences)
+        with context.stats.stage("get_restaurants_location"):
+            locations = self.get_restaurants_location(restaurants)
+        with context.stats.stage("get_transports"):
+            available_transports, ride_shares = self.get_transports(locations, low_co2, other_preferences, transport_preferences, health_conditions, user_neighbourhood)
+
+        # Options' extraction given the results
+        candidates = []
+        for restaurant in restaurants:
+            key = next(iter(restaurant))
+            for neighbourhood in restaurant[key]["neighbourhood"]:
+                for meal in restaurant[key]["meals"]:
+                    candidates.append((self.kb.ids[key], neighbourhood, meal))
+
+        context.stats.count("restaurants", len(restaurants))
+        context.stats.count("options", len(available_transports) * len(candidates))
+        return available_transports, candidates
+
+
+    def stream_top_options(self, context, transports, restaurants, user_neighbourhood, top_k, block_size=64):
+        # Same result as rank_options over the full grid with top_k, without materializing it. restaurants is an
+        # iterable of (restaurant, eligible meals) in catalog order. The food discount can only lower the food
+        # utility, so the undiscounted food score of the best meal and the largest duration term of each transport give
+        # an upper bound of the utility of every option of a restaurant.
+        if len(transports) == 0 or top_k <= 0:
+            for _ in restaurants: pass
+            return OptionTable.empty(self.kb.names, transports)
+
+        transport_ids = [self.kb.ids[transport] for transport in transports]
+        transport_scores = np.array([context.weights["TRANSPORT_CO2"] * abs(self.kb.first(t, "co2Footprint") - 100) + \
+            context.weights["TRANSPORT_COST"] * abs(self.kb.first(t, "cost") - 100) for t in transport_ids])
+        durations = {}
+        food_bounds = {}
+
+        bounded = []
+        for position, (restaurant, meals) in enumerate(restaurants):
+            neighbourhoods = self.kb.get(restaurant, "hasEstablishmentAt")
+            for neighbourhood in neighbourhoods:
+                if neighbourhood not in durations:
+                    durations[neighbourhood] = self.get_durations(transport_ids, neighbourhood, user_neighbourhood)
+            for meal in meals:
+                if meal not in food_bounds:
+                    foods = self.kb.get(meal, "hasFood")
+                    food_bounds[meal] = sum(abs(self.kb.first(food, "co2Footprint") - 100) for food in foods) / len(foods) if len(foods) > 0 else 0
+            longest = np.max([durations[n] for n in neighbourhoods], axis=0)
+            best_transport = np.max(transport_scores + context.weights["TRANSPORT_DURATION"] * longest).item()
+            bound = (context.weights["MAIN_TRANSPORT"] * best_transport + \
+                context.weights["MAIN_FOOD"] * max(food_bounds[meal] for meal in meals)) / 100
+            bounded.append((-bound, position, restaurant, meals))
+        bounded.sort()
+
+        # Min-heap with the best top_k so far, ties are broken like the full grid: (transport, restaurant, neighbourhood, meal)
+        heap = []
+        for start in range(0, len(bounded), block_size):
+            block = bounded[start:start + block_size]
+            if len(heap) == top_k and round(-block[0][0] + 1e-9, 2) < heap[0][0]:
+                context.stats.count("restaurants_skipped", len(bounded) - start)
+                break
+            candidates = []
+            positions = []
+            for _, position, restaurant, meals in block:
+                for n, neighbourhood in enumerate(self.kb.get(restaurant, "hasEstablishmentAt")):
+                    for m, meal in enumerate(meals):
+                        candidates.append((restaurant, neighbourhood, meal))
+                        positions.append((position, n, m))
+            co2, utility = self.score_options(context, transports, candidates, user_neighbourhood)
+            threshold = heap[0][0] if len(heap) == top_k else -np.inf
+            for i, j in zip(*np.nonzero(utility >= threshold)):
+                position, n, m = positions[j]
+                entry = (utility[i, j].item(), (-i, -position, -n, -m), (i, candidates[j], co2[i, j].item()))
+                if len(heap) < top_k:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+
+        rows = [(i, restaurant, self.kb.first(neighbourhood, "belongsToCity"), neighbourhood, meal, co2, score)
+            for score, _, (i, (restaurant, neighbourhood, meal), co2) in sorted(heap, key=lambda entry: entry[:2], reverse=True)]
+        return OptionTable(self.kb.names, transports, *zip(*rows)) if rows else OptionTable.empty(self.kb.names, transports)
+
+
+    def rank_options(self, transports, candidates, co2, utility, top_k=None):
+        # Table of the options from the highest utility to the lowest, ties keep the enumeration order
+        # (transport, restaurant, neighbourhood, meal). Only ids and values are sorted, the dicts of the
+        # options are built by the table when they are read.
+        n_candidates = len(candidates)
+        scores = utility.ravel()
+        order = np.argsort(-scores, kind="stable")
+        if top_k is not None:
+            order = order[:top_k]
+        if n_candidates == 0:
+            return OptionTable.empty(self.kb.names, transports)
+
+        candidates = np.array(candidates, dtype=np.int64)
+        cities = {}
+        for neighbourhood in candidates[:, 1].tolist():
+            if neighbourhood not in cities:
+                cities[neighbourhood] = self.kb.first(neighbourhood, "belongsToCity")
+        transport, column = np.divmod(order, n_candidates)
+        rows = candidates[column]
+        return OptionTable(self.kb.names, transports, transport, rows[:, 0], [cities[n] for n in rows[:, 1].tolist()], rows[:, 1], rows[:, 2],
+            co2.ravel()[order], scores[order])
+
+
+    def pareto_frontier(self, df, context=None):
+        # Options of the request that are the best one for some weights, context.options gets them ranked with the
+        # weights of the request and rank_frontier ranks them for any other weights without building the grid again
+        if context is None:
+            context = RequestContext()
+        with self.kb_lock.reading():
+            preferences = self.process_request(context, df, False)
+            key = ("frontier",) + self.request_key(preferences)
+            frontier = self.result_cache.get(key, self.version)
+            context.stats.cache("results", frontier is not None)
+            if frontier is None:
+                frontier = self.compute_frontier(context, *preferences)
+                self.result_cache.put(key, self.version, frontier)
+        context.options = self.rank_frontier(frontier, context.weights)
+        return frontier
+
+
+    def compute_frontier(self, context, health_conditions, transport_preferences, preferred_cuisines, avoid_cuisines, low_co2,
+        other_preferences, restaurant_crowdedness, user_neighbourhood):
+        transports, candidates = self.option_grid(context, health_conditions, transport_preferences, preferred_cuisines, avoid_cuisines,
+            low_co2, other_preferences, restaurant_crowdedness, user_neighbourhood)
+        if len(transports) == 0 or len(candidates) == 0:
+            return ParetoFrontier(OptionTable.empty(self.kb.names, transports), np.zeros((0, 4)), 0)
+
+        with context.stats.stage("pareto_frontier"):
+            transport_co2, transport_cost, food, food_normalized, duration = self.score_terms(context, transports, candidates, user_neighbourhood)
+            co2_term = np.abs(transport_co2 - 100)
+            cost_term = np.abs(transport_cost - 100)
+            # An option with a transport (or a candidate) dominated on its own terms is dominated by the option with the
+            # dominating one instead, so only the pairs of the two much smaller skylines are compared. With routing the
+            # duration depends on the transport too: every transport is kept with the skyline of its own candidates.
+            if len(duration) == 1:
+                transport_rows = skyline(np.column_stack([co2_term, cost_term, -transport_co2]))
+                candidate_rows = [skyline(np.column_stack([duration[0], food_normalized, -food]))] * len(transport_rows)
+            else:
+                transport_rows = np.arange(len(transports))
+                candidate_rows = [skyline(np.column_stack([duration[t], food_normalized, -food])) for t in transport_rows]
+            transport = np.concatenate([np.full(len(rows), t, dtype=np.int64) for t, rows in zip(transport_rows, candidate_rows)])
+            column = np.concatenate(candidate_rows)
+            duration = np.broadcast_to(duration, (len(transports), len(candidates)))
+            terms = np.column_stack([co2_term[transport], cost_term[transport], duration[transport, column], food_normalized[column]])
+            kept = skyline(np.column_stack([terms, -(transport_co2[transport] + food[column])]))
+            transport, column, terms = transport[kept], column[kept], terms[kept]
+        context.stats.count("frontier_options", len(kept))
+
+        rows = np.array(candidates, dtype=np.int64)[column]
+        cities = [self.kb.first(neighbourhood, "belongsToCity") for neighbourhood in rows[:, 1].tolist()]
+        utility = combine_utility(context.weights, terms[:, 0], terms[:, 1], terms[:, 2], terms[:, 3])
+        table = OptionTable(self.kb.names, transports, transport, rows[:, 0], cities, rows[:, 1], rows[:, 2], transport_co2[transport] + food[column], utility)
+        return ParetoFrontier(table, terms, len(transports) * len(candidates))
+
+
+    def rank_frontier(self, frontier, weights):
+        # Options of the frontier from the highest utility to the lowest for the weights (the keys of RequestContext.weights),
+        # ties keep the enumeration order like rank_options
+        terms = frontier.terms
+        utility = combine_utility(weights, terms[:, 0], terms[:, 1], terms[:, 2], terms[:, 3])
+        order = np.argsort(-utility, kind="stable")
+        table = frontier.table.select(order)
+        table.utility = utility[order]
+        return table
+
+
+    def option_terms(self, df, context=None):
+        # Terms of the utility of every option of the request in enumeration order (transport, then candidate) like
+        # rank_options: transport CO2 score, cost score, duration and normalized food utility. The utility of the
+        # options for any weights is this matrix times the coefficients of the weights (see sensitivity.py).
+        if context is None:
+            context = RequestContext()
+        with self.kb_lock.reading():
+            preferences = self.process_request(context, df, False)
+            transports, candidates = self.option_grid(context, *preferences)
+            if len(transports) == 0 or len(candidates) == 0:
+                return np.zeros((0, 4))
+            transport_co2, transport_cost, _, food_normalized, duration = self.score_terms(context, transports, candidates, preferences[-1])
+        n_candidates = len(candidates)
+        return np.column_stack([np.repeat(np.abs(transport_co2 - 100), n_candidates), np.repeat(np.abs(transport_cost - 100), n_candidates),
+            np.broadcast_to(duration, (len(transports), n_candidates)).ravel(), np.tile(food_normalized, len(transports))])
+
+
+    def display_options(self, context, options=None):
+        # options is any iterable of options sorted by utility (e.g. the lazy iterator of recommend),
+        # when it is not given the options are read back from the output file of the request
         print("\n** AGENT OUTPUT **\n")
 
-        food = self.weights["MAIN_FOOD"]
-        transport = self.weights["MAIN_TRANSPORT"]
-        co2 = self.weights["TRANSPORT_CO2"]
-        cost = self.weights["TRANSPORT_COST"]
-        duration = self.weights["TRANSPORT_DURATION"]
+        food = context.weights["MAIN_FOOD"]
+        transport = context.weights["MAIN_TRANSPORT"]
+        co2 = context.weights["TRANSPORT_CO2"]
+        cost = context.weights["TRANSPORT_COST"]
+        duration = context.weights["TRANSPORT_DURATION"]
 
         print(f"Assigned preferences weights:")
         print(f"\tFood: {round(food, 2)}")
@@ -439,47 +970,41 @@ class Agent:
 
         print("\nOptions found:")
 
-        options = None
-        try:
-            with open("output.json", "r") as f:
-                options = json.load(f)
-        except json.JSONDecodeError:
-            pass
-        except IOError:
-            pass
+        if options is None:
+            options = {}
+            try:
+                with open(context.output_path, "r") as f:
+                    options = json.load(f)
+            except json.JSONDecodeError:
+                pass
+            except IOError:
+                pass
+            options = options.values()
 
-        if len(options) == 0:
+        # Options are only pulled from the iterator when they are displayed, the cheaper alternatives need all of them
+        pending = iter(options)
+        seen = []
+        next_option = next(pending, None)
+        if next_option is not None:
+            seen.append(next_option)
+
+        if len(seen) == 0:
             print(f"\nThe agent could not find a feasible combination of transport and food that complies with your preferences. Try to underconstraint a little bit your selection.")
         else:
             finished = False
             counter = 0
             more = ""
-            restaurant_names = []
-            available_restaurants = []
-            cheap_dict = {}
-
-            for restaurant in self.restaurants_cheap:
-                restaurant_names.append(restaurant.name)
-
-            for entry in options:
-                if options[entry]["restaurant"] not in available_restaurants:
-                    available_restaurants.append(options[entry]["restaurant"])
-
-            for available_restaurant in available_restaurants:
-                cheap_arr = self.restaurants_cheap[:restaurant_names.index(available_restaurant)]
-                cheap_dict[available_restaurant] = []
-                cheap_arr.reverse()
-                for entry_restaurant in cheap_arr:
-                    if entry_restaurant.name in available_restaurants:
-                        cheap_dict[available_restaurant].append(entry_restaurant.name)
+            cheap_dict = None
 
             while not finished:
-                try:
-                    option = list(options)[counter]
-                except IndexError:
+                while len(seen) <= counter:
+                    next_option = next(pending, None)
+                    if next_option is None: break
+                    seen.append(next_option)
+                if len(seen) <= counter:
                     print("\nThere is no more options to display. Thanks for using the system!")
                     break
-                selected_option = options[option]
+                selected_option = seen[counter]
                 print(f"\nThe selected restaurant is {selected_option['restaurant']} located in {selected_option['city']} ({selected_option['neighbourhood']}) where you can eat {selected_option['meal']}. You will get there by {selected_option['transport']}. This option has a total CO2 consumption of {selected_option['co2']} and an utility of {selected_option['utility']} calculated by the agent and respecting all of your preferences.")
                 while more not in ["y", "n", "c"]:
                     more = input("\nDo you want to see the next best option by utility (y/n) or do you want something cheaper (c)? (y/n/c): ")
@@ -488,15 +1013,18 @@ class Agent:
                     counter += 1
                 elif more == "c":
                     more = ""
+                    if cheap_dict is None:
+                        seen.extend(pending)
+                        cheap_dict = self.get_cheaper_restaurants(seen)
                     selected_name = selected_option['restaurant']
                     cheaper_arr = cheap_dict[selected_name]
                     cheaper_arr.reverse()
                     while len(cheaper_arr) > 0:
                         alternative = cheaper_arr.pop()
                         alt_option = False
-                        for entry in options:
-                            if options[entry]["restaurant"] == alternative:
-                                alt_option = options[entry]
+                        for entry in seen:
+                            if entry["restaurant"] == alternative:
+                                alt_option = entry
                         if alt_option:
                             print(f"\nThe cheaper alternative is {alt_option['restaurant']} located in {selected_option['city']} ({selected_option['neighbourhood']}) where you can eat {alt_option['meal']}. You will get there by {alt_option['transport']}. This option has a total CO2 consumption of {alt_option['co2']} and an utility of {alt_option['utility']} calculated by the agent and respecting all of your preferences.")
                             more_alt = input("\nDo you want to try to find a cheaper option? (y/n): ")
@@ -505,3 +1033,56 @@ class Agent:
                 else:
                     print(f"\nThanks for using the system!")
                     finished = True
+
+
+    def get_cheaper_restaurants(self, options):
+        # For every restaurant in the options, the other restaurants in the options that are cheaper (closest first)
+        available_restaurants = []
+        for entry in options:
+            if entry["restaurant"] not in available_restaurants:
+                available_restaurants.append(entry["restaurant"])
+
+        by_price = sorted(available_restaurants, key=lambda name: self.kb.price_rank[self.kb.ids[name]])
+        cheap_dict = {}
+        for rank, restaurant in enumerate(by_price):
+            cheap_dict[restaurant] = by_price[:rank][::-1]
+
+        return cheap_dict
+
+
+def verify_scores(path="infoiag_project_2021_group1.owl", routing="hops"):
+    # Compares score_options with the scalar reference (calculate_co2 and get_utility) on every option of the stored
+    # scenarios. Prints the differences and returns True when there are none.
+    agent = Agent(path, routing=routing)
+    with ScenarioStore() as scenarios:
+        rows = scenarios.scenarios()
+    checked = 0
+    differences = 0
+    for number, row in rows:
+        context = RequestContext()
+        try:
+            preferences = agent.process_request(context, row, False)
+        except ValueError as e:
+            print(f"\tscenario {number} skipped: {e}")
+            continue
+        user_neighbourhood = preferences[-1]
+        transports, candidates = agent.option_grid(context, *preferences)
+        co2, utility = agent.score_options(context, transports, candidates, user_neighbourhood)
+        for i, transport in enumerate(transports):
+            for j, (restaurant, neighbourhood, meal) in enumerate(candidates):
+                expected_co2 = agent.calculate_co2(transport, meal, neighbourhood)
+                expected_utility = agent.get_utility(context, transport, meal, neighbourhood, user_neighbourhood)
+                checked += 1
+                if not math.isclose(co2[i, j], expected_co2) or not math.isclose(utility[i, j], expected_utility):
+                    differences += 1
+                    print(f"\tscenario {number}, {transport} to {agent.kb.names[restaurant]} ({agent.kb.names[neighbourhood]}) for {agent.kb.names[meal]}: "
+                        f"co2 {co2[i, j]} instead of {expected_co2}, utility {utility[i, j]} instead of {expected_utility}")
+    print(f"{checked} options compared, {differences} with different scores")
+    return differences == 0
+
+
+if __name__ == '__main__':
+    # python agent.py [hops|transport], checks the vectorized scores against the scalar ones
+    import sys
+
+    sys.exit(0 if verify_scores(routing=sys.argv[1] if len(sys.argv) > 1 else "hops") else 1)
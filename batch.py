@@ -0,0 +1,66 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import agent
+from request_context import RequestContext
+from scenario_store import ScenarioStore
+
+# Agent of the current process. The parent builds it before starting the pool, so with fork the workers
+# inherit the reasoned knowledge base, otherwise each worker loads it from the knowledge base cache once
+_agent = None
+
+
+def _init_worker(ontology_path, quadstore_path, routing, reasoner):
+    global _agent
+    if _agent is None:
+        _agent = agent.Agent(ontology_path, reasoner=reasoner, quadstore=quadstore_path, routing=routing)
+
+
+def _run_scenario(task):
+    scenario_number, preferences, top_k = task
+    context = RequestContext()
+    try:
+        options = _agent.recommend(preferences, top_k=top_k, context=context)
+    except (KeyError, ValueError) as e:
+        return {"scenario": scenario_number, "error": str(e)}
+    return {"scenario": scenario_number, "weights": context.weights, "options": list(options), "stats": context.stats.as_dict()}
+
+
+def run_batch(start=None, stop=None, scenarios_path="scenarios.db", output_path="batch_output.jsonl", top_k=None, workers=None, ontology_path="infoiag_project_2021_group1.owl",
+        quadstore_path=None, routing="hops", reasoner="native"):
+    # Evaluates the scenarios [start, stop) and writes one JSON line per scenario, in scenario order
+    global _agent
+    with ScenarioStore(scenarios_path) as store:
+        tasks = [(n, scenario, top_k) for n, scenario in store.scenarios(start, stop)]
+
+    if _agent is None:
+        _agent = agent.Agent(ontology_path, reasoner=reasoner, quadstore=quadstore_path, routing=routing)
+
+    if workers is None:
+        workers = min(len(tasks), os.cpu_count() or 1)
+
+    with open(output_path, "w") as f:
+        if workers <= 1:
+            results = map(_run_scenario, tasks)
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        else:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(ontology_path, quadstore_path, routing, reasoner)) as executor:
+                for result in executor.map(_run_scenario, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+                    f.write(json.dumps(result) + "\n")
+
+    return len(tasks)
+
+
+def parse_range(text):
+    # "all", "n" or "start-stop" (both included) to a (start, stop) slice
+    if text == "all":
+        return None, None
+    if "-" in text:
+        start, stop = text.split("-", 1)
+        return int(start), int(stop) + 1
+    return int(text), int(text) + 1
@@ -0,0 +1,222 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+# Synthetic ontologies reuse the classes and properties of the real one (the individuals are replaced),
+# so the agent runs on them unchanged. Every size is measured in a fresh process: owlready2 keeps loaded
+# ontologies in a global world and the peak memory of a process never goes down.
+
+SCHEMA_PATH = "infoiag_project_2021_group1.owl"
+LOCATIONS = ["seaside", "countryside", "mountain", "island"]
+NUTRIENTS = ["fat", "gluten", "lactose", "potasium", "protein", "vitamins"]
+CROWDEDNESS = ["lowCrowdedness", "mediumCrowdedness", "highCrowdedness"]
+TRANSPORTS = {  # co2Footprint, duration, cost
+    "bike": (0, 75, 10),
+    "electricCar": (50, 30, 90),
+    "gasolineCar": (90, 20, 70),
+    "rideShare": (30, 40, 45),
+    "train": (20, 50, 40),
+    "walking": (0, 100, 0),
+}
+
+
+def generate_ontology(path, restaurants, neighbourhoods_per_city=20, n_cuisines=20, meals_per_cuisine=10, n_foods=200, seed=0):
+    import owlready2
+
+    rng = random.Random(seed)
+    world = owlready2.World()
+    onto = world.get_ontology(f"file://{os.path.abspath(SCHEMA_PATH)}").load()
+    for individual in list(onto.individuals()):
+        owlready2.destroy_entity(individual)
+
+    n_neighbourhoods = max(neighbourhoods_per_city, restaurants // 2)
+    n_cities = max(1, n_neighbourhoods // neighbourhoods_per_city)
+
+    with onto:
+        locations = [onto.Location(name) for name in LOCATIONS]
+        nutrients = [onto.Nutrients(name) for name in NUTRIENTS]
+        crowdedness = [onto.Crowdedness(name) for name in CROWDEDNESS]
+        for name, (co2, duration, cost) in TRANSPORTS.items():
+            onto.Transport(name, co2Footprint=[co2], duration=duration, cost=[cost])
+
+        neighbourhoods = []
+        for c in range(n_cities):
+            city_class = onto.BigCity if c % 4 == 0 else onto.City
+            city = city_class(f"city{c}", locatedAt=rng.choice(locations))
+            city_neighbourhoods = []
+            for n in range(neighbourhoods_per_city):
+                neighbourhood = onto.Neighbourhood(f"city{c}n{n}", belongsToCity=city, nHabitants=rng.randint(1000, 60000),
+                    hasTrainStation=city_class is onto.BigCity)
+                # Random spanning tree plus a few shortcuts, kept symmetric like in the real ontology
+                if city_neighbourhoods:
+                    others = [rng.choice(city_neighbourhoods)]
+                    if rng.random() < 0.2:
+                        others.append(rng.choice(city_neighbourhoods))
+                    for other in set(others):
+                        neighbourhood.adjacentTo.append(other)
+                        other.adjacentTo.append(neighbourhood)
+                city_neighbourhoods.append(neighbourhood)
+            neighbourhoods.extend(city_neighbourhoods)
+
+        foods = []
+        for f in range(n_foods):
+            foods.append(onto.Food(f"food{f}", co2Footprint=[rng.randint(1, 100)], hasNutrients=rng.sample(nutrients, rng.randint(1, 3)),
+                producedIn=rng.sample(locations, rng.randint(1, 2))))
+
+        cuisines = []
+        for c in range(n_cuisines):
+            meals = [onto.Meal(f"cuisine{c}meal{m}", hasFood=rng.sample(foods, rng.randint(1, 5))) for m in range(meals_per_cuisine)]
+            cuisines.append(onto.Cuisine(f"cuisine{c}", servesMeals=meals))
+
+        previous = None
+        for r in range(restaurants):
+            restaurant = onto.Restaurant(f"restaurant{r}", hasCuisine=rng.choice(cuisines), hasCrowdedness=[rng.choice(crowdedness)],
+                hasEstablishmentAt=rng.sample(neighbourhoods, rng.randint(1, 3)))
+            if previous is not None:
+                previous.isCheaperThan.append(restaurant)
+            previous = restaurant
+
+    onto.save(file=path, format="rdfxml")
+    return {"cities": n_cities, "neighbourhoods": len(neighbourhoods), "cuisines": n_cuisines, "meals": n_cuisines * meals_per_cuisine, "foods": n_foods}
+
+
+def generate_scenarios(n, n_cuisines, n_cities, neighbourhoods_per_city, seed=0):
+    # Rows with the same keys as the ones filled in the form
+    rng = random.Random(seed)
+    scenarios = []
+    for _ in range(n):
+        co2 = rng.choice(["none", "low_food", "low_transport", "low_food_and_transport"])
+        transport = rng.choice(["none", "fast", "cheap"])
+        crowdedness = rng.choice(["none", "low", "high"])
+        scenario = {
+            "condition_covid": int(rng.random() < 0.1), "condition_gluten": int(rng.random() < 0.1),
+            "condition_lactose": int(rng.random() < 0.1), "condition_muscle_ache": int(rng.random() < 0.1),
+            "cuisine_food_pref": [f"cuisine{c}" for c in rng.sample(range(n_cuisines), rng.randint(0, 3))],
+            "cuisine_food_avoid": [],
+            "restaurant_price_range": rng.choice(["Cheap", "Moderate", "Expensive"]),
+            "select_neighbourhood": f"city{rng.randrange(n_cities)}n{rng.randrange(neighbourhoods_per_city)}",
+        }
+        for name in ["none", "low_food", "low_transport", "low_food_and_transport"]:
+            scenario[f"pref_co2_{name}"] = int(co2 == name)
+        for name in ["none", "fast", "cheap"]:
+            scenario[f"pref_transport_{name}"] = int(transport == name)
+        for name in ["none", "low", "high"]:
+            scenario[f"pref_crowdedness_{name}"] = int(crowdedness == name)
+        for name in ["bike", "electric_car", "gas_car", "rideshare", "train", "walk"]:
+            scenario[f"pref_transport_{name}"] = int(rng.random() < 0.6)
+        scenarios.append(scenario)
+    return scenarios
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_size(config):
+    # Measures one size in the current (fresh) process
+    import agent
+
+    restaurants, requests, neighbourhoods_per_city, workdir = config["restaurants"], config["requests"], config["neighbourhoods_per_city"], config["workdir"]
+    path = os.path.join(workdir, f"synthetic_{restaurants}.owl")
+    cache_path = os.path.join(workdir, f"synthetic_{restaurants}.kb.pickle")
+
+    start = time.perf_counter()
+    shape = generate_ontology(path, restaurants, neighbourhoods_per_city)
+    generation = time.perf_counter() - start
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    cold = agent.Agent(path, cache_path=cache_path)
+    cold_start = time.perf_counter() - start
+    startup_stats = cold.startup_stats
+    load_peak = tracemalloc.get_traced_memory()[1]
+    del cold
+
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    a = agent.Agent(path, cache_path=cache_path)
+    warm_start = time.perf_counter() - start
+
+    latencies = []
+    options = []
+    for scenario in generate_scenarios(requests, shape["cuisines"], shape["cities"], neighbourhoods_per_city):
+        start = time.perf_counter()
+        options.append(len(a.recommend(scenario, top_k=10)))
+        latencies.append(time.perf_counter() - start)
+    request_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings = startup_stats["timings"]
+    return {
+        "restaurants": restaurants,
+        **shape,
+        "generation_s": round(generation, 4),
+        "load_ontology_s": round(timings.get("load_ontology", 0), 4),
+        "reasoning_s": round(timings.get("sync_reasoner", 0), 4),
+        "materialize_s": round(timings.get("materialize", 0), 4),
+        "compile_s": round(timings.get("compile_knowledge_base", 0), 4),
+        "cold_start_s": round(cold_start, 4),
+        "warm_start_s": round(warm_start, 4),
+        "request_mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "request_p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "request_p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "options_returned_mean": round(statistics.mean(options), 2),
+        "load_peak_mb": round(load_peak / 2 ** 20, 2),
+        "request_peak_mb": round(request_peak / 2 ** 20, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+    }
+
+
+def compare(results, previous):
+    # Ratio new / previous for every metric of the sizes present in both reports
+    previous = {entry["restaurants"]: entry for entry in previous["results"]}
+    for entry in results:
+        old = previous.get(entry["restaurants"])
+        if old is None: continue
+        print(f"\n{entry['restaurants']} restaurants vs previous run:")
+        for key, value in entry.items():
+            if key.endswith(("_s", "_ms", "_mb")) and old.get(key):
+                print(f"\t{key}: {old[key]} -> {value} ({value / old[key]:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the agent on synthetic ontologies")
+    parser.add_argument("--restaurants", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--neighbourhoods-per-city", type=int, default=20)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="report of a previous run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        context = multiprocessing.get_context("spawn")
+        for restaurants in args.restaurants:
+            config = {"restaurants": restaurants, "requests": args.requests, "neighbourhoods_per_city": args.neighbourhoods_per_city, "workdir": workdir}
+            with context.Pool(1) as pool:
+                result = pool.apply(run_size, (config,))
+            results.append(result)
+            print(json.dumps(result))
+
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "machine": platform.machine(),
+        "requests": args.requests, "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,7 @@
 import PySimpleGUI as sg
-import pandas as pd
 from owlready2 import *
-import json
 
-sg.theme('DarkTeal9')
-
-base_dict = {"condition_covid":{},"condition_gluten":{},"condition_lactose":{},"condition_muscle_ache":{},"cuisine_food_avoid":{},"cuisine_food_pref":{},"pref_co2_low_food":{},"pref_co2_low_food_and_transport":{},"pref_co2_low_transport":{},"pref_co2_none":{},"pref_crowdedness_high":{},"pref_crowdedness_low":{},"pref_crowdedness_none":{},"pref_transport_bike":{},"pref_transport_cheap":{},"pref_transport_electric_car":{},"pref_transport_fast":{},"pref_transport_gas_car":{},"pref_transport_none":{},"pref_transport_rideshare":{},"pref_transport_train":{},"pref_transport_walk":{},"restaurant_price_range":{},"select_cities":{},"select_neighbourhood":{}}
+from scenario_store import ScenarioStore
 
 foods_to_co2_emissions = {
     "steak":100,
@@ -33,68 +29,72 @@ foods_to_co2_emissions = {
     "algea_roll":1
 }
 
-onto = get_ontology("infoiag_project_2021_group1.owl")
-onto.load()
-cities = onto.search(is_a=onto.City)
-meals = onto.search(is_a=onto.Cuisine)
-cities_list = []
-meals_list = []
 
-city_to_neighbourhoods = {}
+def build_window():
+    # The ontology data shown in the widgets and the window itself are only built when the form is opened,
+    # so importing this module (or running the agent headless) does not pay for them
+    sg.theme('DarkTeal9')
+
+    onto = get_ontology("infoiag_project_2021_group1.owl")
+    onto.load()
+    cities = onto.search(is_a=onto.City)
+    meals = onto.search(is_a=onto.Cuisine)
+    cities_list = []
+    meals_list = []
+
+    city_to_neighbourhoods = {}
 
-neighbourhoods_with_train_station = []
-for element in cities:
-    if element.name == "City" or element.name =="BigCity": continue
-    cities_list.append(element.name)
-    neighbourhoods = onto.search(is_a=onto.Neighbourhood,belongsToCity=element)
-    city_to_neighbourhoods[element.name] = [neigh.name for neigh in neighbourhoods]
-    if element.is_a[0] == onto.BigCity: # big cities have neighbourhoods with more than 20 000 inhabitants and have train stations in each
-        neighbourhoods_with_train_station = neighbourhoods_with_train_station + [neigh.name for neigh in neighbourhoods]
-        # they also have electric car charging ports
+    neighbourhoods_with_train_station = []
+    for element in cities:
+        if element.name == "City" or element.name =="BigCity": continue
+        cities_list.append(element.name)
+        neighbourhoods = onto.search(is_a=onto.Neighbourhood,belongsToCity=element)
+        city_to_neighbourhoods[element.name] = [neigh.name for neigh in neighbourhoods]
+        if element.is_a[0] == onto.BigCity: # big cities have neighbourhoods with more than 20 000 inhabitants and have train stations in each
+            neighbourhoods_with_train_station = neighbourhoods_with_train_station + [neigh.name for neigh in neighbourhoods]
+            # they also have electric car charging ports
 
-for meal in meals:
-    if meal.name == "Cuisine": continue
-    meals_list.append(meal.name)
+    for meal in meals:
+        if meal.name == "Cuisine": continue
+        meals_list.append(meal.name)
 
-layout = [
-    [sg.Text('Preffered cuisine or food choices', size=(30, 1)), sg.Listbox(values=meals_list, size=(30, len(meals_list) + 1),select_mode="multiple", key='cuisine_food_pref', enable_events=True)],
-    [sg.Text('Cuisine or food choices to avoid', size=(30, 1)), sg.Listbox(values=meals_list, size=(30, len(meals_list) + 1),select_mode="multiple", key='cuisine_food_avoid', enable_events=True)],
+    layout = [
+        [sg.Text('Preffered cuisine or food choices', size=(30, 1)), sg.Listbox(values=meals_list, size=(30, len(meals_list) + 1),select_mode="multiple", key='cuisine_food_pref', enable_events=True)],
+        [sg.Text('Cuisine or food choices to avoid', size=(30, 1)), sg.Listbox(values=meals_list, size=(30, len(meals_list) + 1),select_mode="multiple", key='cuisine_food_avoid', enable_events=True)],
 
 
-    [sg.Text('Select a restaurant price range', size=(30, 1)), sg.Combo(['Cheap', 'Moderate', 'Expensive'], key='restaurant_price_range')],
-    # either the above or we make them enter their savings /salary as input text and then we determine whether we find them cheap moderate or expensive restaurants,
-    # but they might want cheap restaurants even if they earn little or vice versa
+        [sg.Text('Select a restaurant price range', size=(30, 1)), sg.Combo(['Cheap', 'Moderate', 'Expensive'], key='restaurant_price_range')],
+        # either the above or we make them enter their savings /salary as input text and then we determine whether we find them cheap moderate or expensive restaurants,
+        # but they might want cheap restaurants even if they earn little or vice versa
 
-    # [sg.Text('Do you want to eat out', size=(30, 1)), sg.Radio('Yes', "RADIO1", key="eat_out_yes", default=True), sg.Radio('No', "RADIO1", key="eat_out_no")],
-    # # seems unnecesary, doesnt everyone?
+        # [sg.Text('Do you want to eat out', size=(30, 1)), sg.Radio('Yes', "RADIO1", key="eat_out_yes", default=True), sg.Radio('No', "RADIO1", key="eat_out_no")],
+        # # seems unnecesary, doesnt everyone?
 
-    [sg.Text('Select the city you live in', size=(30, 1)), sg.Combo(cities_list, key='select_cities', enable_events=True)],
-    [sg.Text('Select the neighbourhood you live in', size=(30, 1)), sg.Combo(['Please select a city first'], key='select_neighbourhood', enable_events=True)],
+        [sg.Text('Select the city you live in', size=(30, 1)), sg.Combo(cities_list, key='select_cities', enable_events=True)],
+        [sg.Text('Select the neighbourhood you live in', size=(30, 1)), sg.Combo(['Please select a city first'], key='select_neighbourhood', enable_events=True)],
 
 
-    [sg.Text('Select the modes of transport you preffer', size=(30, 1)),sg.Checkbox('Car (gas)', key="pref_transport_gas_car"), sg.Checkbox('Car (electric)',key="pref_transport_electric_car"), sg.Checkbox('Ride-share', key="pref_transport_rideshare"), sg.Checkbox('Train',key="pref_transport_train"), sg.Checkbox('Bike', key="pref_transport_bike"),sg.Checkbox('Walking', key="pref_transport_walk")],
+        [sg.Text('Select the modes of transport you preffer', size=(30, 1)),sg.Checkbox('Car (gas)', key="pref_transport_gas_car"), sg.Checkbox('Car (electric)',key="pref_transport_electric_car"), sg.Checkbox('Ride-share', key="pref_transport_rideshare"), sg.Checkbox('Train',key="pref_transport_train"), sg.Checkbox('Bike', key="pref_transport_bike"),sg.Checkbox('Walking', key="pref_transport_walk")],
 
-    [sg.Text('Select any health conditions you have', size=(30, 1)), sg.Checkbox('Muscle ache', key="condition_muscle_ache"),sg.Checkbox('COVID symptoms', key="condition_covid"), sg.Checkbox('Gluten allergy',key="condition_gluten"), sg.Checkbox('Lactose intolerance', key="condition_lactose")],
+        [sg.Text('Select any health conditions you have', size=(30, 1)), sg.Checkbox('Muscle ache', key="condition_muscle_ache"),sg.Checkbox('COVID symptoms', key="condition_covid"), sg.Checkbox('Gluten allergy',key="condition_gluten"), sg.Checkbox('Lactose intolerance', key="condition_lactose")],
 
-    [sg.Text('Select any additional preferences', size=(30, 1)), sg.Radio('No CO2 preference', "RADIO2", default=True, key="pref_co2_none"),sg.Radio('Low CO2 food', "RADIO2",key="pref_co2_low_food"),sg.Radio('Low Co2 transport', "RADIO2", key="pref_co2_low_transport"),sg.Radio('Low Co2 food and transport', "RADIO2", key="pref_co2_low_food_and_transport")],
-    [sg.Text('', size=(30, 1)), sg.Radio('No transport preference', "RADIO3", default=True, key="pref_transport_none"), sg.Radio('Fast transport', "RADIO3",key="pref_transport_fast"), sg.Radio('Cheap transport', "RADIO3", key="pref_transport_cheap")],
-    [sg.Text('', size=(30, 1)), sg.Radio('No crowdedness preference', "RADIO4", default=True, key="pref_crowdedness_none"), sg.Radio('Low crowdedness', "RADIO4", key="pref_crowdedness_low"),sg.Radio('High crowdedness', "RADIO4", key="pref_crowdedness_high")],
+        [sg.Text('Select any additional preferences', size=(30, 1)), sg.Radio('No CO2 preference', "RADIO2", default=True, key="pref_co2_none"),sg.Radio('Low CO2 food', "RADIO2",key="pref_co2_low_food"),sg.Radio('Low Co2 transport', "RADIO2", key="pref_co2_low_transport"),sg.Radio('Low Co2 food and transport', "RADIO2", key="pref_co2_low_food_and_transport")],
+        [sg.Text('', size=(30, 1)), sg.Radio('No transport preference', "RADIO3", default=True, key="pref_transport_none"), sg.Radio('Fast transport', "RADIO3",key="pref_transport_fast"), sg.Radio('Cheap transport', "RADIO3", key="pref_transport_cheap")],
+        [sg.Text('', size=(30, 1)), sg.Radio('No crowdedness preference', "RADIO4", default=True, key="pref_crowdedness_none"), sg.Radio('Low crowdedness', "RADIO4", key="pref_crowdedness_low"),sg.Radio('High crowdedness', "RADIO4", key="pref_crowdedness_high")],
 
-    [sg.Submit(), sg.Button('Clear'), sg.Exit()]
-]
+        [sg.Submit(), sg.Button('Clear'), sg.Exit()]
+    ]
+
+    window = sg.Window('Simple data entry form', layout)
+
+    return window, meals_list, city_to_neighbourhoods, neighbourhoods_with_train_station
 
-window = sg.Window('Simple data entry form', layout)
 
 def execute_form():
     added_index = None
 
-    json_file = "scenarios.json"
-    try:
-        df = pd.read_json(json_file)
-    except ValueError:
-        with open(json_file, "w") as f:
-            json.dump(base_dict, f)
-        df = pd.read_json(json_file)
+    window, meals_list, city_to_neighbourhoods, neighbourhoods_with_train_station = build_window()
+    store = ScenarioStore()
 
     while True:
         event, values = window.read()
@@ -141,14 +141,12 @@ def execute_form():
             for key, val in values.items():
                 values[key] = 1 if val == True else 0 if val == False else val
 
-            df = df.append(values, ignore_index=True)
-
-            added_index = df.tail(1).index.start
+            added_index = store.append(values)
 
-            df.to_json(json_file, indent=4)
             sg.popup('Data saved!')
             window.close()
 
     window.close()
+    store.close()
 
     return added_index if added_index is not None else None
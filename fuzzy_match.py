@@ -0,0 +1,73 @@
+from Levenshtein import distance
+
+
+def deletions(word, depth):
+    # Every string obtained by removing up to depth characters of word (word included)
+    result = {word}
+    level = {word}
+    for _ in range(depth):
+        level = {variant[:i] + variant[i + 1:] for variant in level for i in range(len(variant))}
+        result |= level
+    return result
+
+
+class FuzzyIndex:
+    # Symmetric deletion index over a fixed list of labels. Two strings at Levenshtein distance d share a string
+    # obtained by removing at most d characters of each one, so the labels close to a word are found by looking
+    # up the deletions of the word instead of comparing it with every label. Same result as a linear scan that keeps
+    # the first label with the smallest distance below threshold.
+
+    def __init__(self, labels, threshold=3):
+        self.labels = list(labels)
+        self.depth = threshold - 1
+        self.positions = {}  # "bike": 3, exact hits
+        self.removed = set()  # positions of the labels discarded after the index was built
+        self.variants = {}  # "bke": 3 or [3, 40], label positions in increasing order
+        for position, label in enumerate(self.labels):
+            self.positions.setdefault(label, position)
+            self.add_variants(label, position)
+
+    def add(self, label):
+        position = len(self.labels)
+        self.labels.append(label)
+        self.positions.setdefault(label, position)
+        self.add_variants(label, position)
+
+    def discard(self, label):
+        position = self.positions.pop(label, None)
+        if position is not None:
+            self.removed.add(position)
+
+    def add_variants(self, label, position):
+        for variant in deletions(label, self.depth):
+            entry = self.variants.get(variant)
+            if entry is None:
+                self.variants[variant] = position
+            elif type(entry) == int:
+                if entry != position:
+                    self.variants[variant] = [entry, position]
+            elif entry[-1] != position:
+                entry.append(position)
+
+    def closest(self, word):
+        position = self.positions.get(word)
+        if position is not None:
+            return self.labels[position]
+
+        best_distance = self.depth + 1
+        best_position = None
+        checked = set()
+        for variant in deletions(word, self.depth):
+            entry = self.variants.get(variant)
+            if entry is None: continue
+            for position in ([entry] if type(entry) == int else entry):
+                if position in checked or position in self.removed: continue
+                checked.add(position)
+                dist = distance(word, self.labels[position], score_cutoff=self.depth)
+                if dist < best_distance or (dist == best_distance and best_position is not None and position < best_position):
+                    best_distance = dist
+                    best_position = position
+        return None if best_position is None else self.labels[best_position]
+
+    def __len__(self):
+        return len(self.labels) - len(self.removed)
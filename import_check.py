@@ -0,0 +1,49 @@
+import subprocess
+import sys
+
+# Modules that must not be imported by the headless entry points ('-scenario n', '-batch', '-server')
+GUI_MODULES = ["form", "PySimpleGUI", "tkinter"]
+
+
+def measure_imports(module="main"):
+    # Runs a fresh interpreter with -X importtime, returns ({module: cumulative microseconds}, modules imported directly)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"Could not import {module}")
+    times = {}
+    children = []
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line: continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit(): continue
+        times[name.strip()] = int(cumulative)
+        # Modules are printed after what they import, indented two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append(name.strip())
+        elif depth == 0:
+            if name.strip() == module:
+                top_level = children
+            children = []
+    return times, top_level
+
+
+def check(module="main", budget=1.0):
+    times, top_level = measure_imports(module)
+    total = times.get(module, 0) / 1e6
+    gui = [name for name in GUI_MODULES if name in times]
+    slowest = sorted(((times[name], name) for name in top_level), reverse=True)[:10]
+
+    print(f"Importing {module} took {total:.3f}s (budget {budget:.3f}s)")
+    for t, name in slowest:
+        print(f"\t{t / 1e6:.3f}s\t{name}")
+    if gui:
+        print(f"The headless path imports the GUI stack: {gui}")
+    return total <= budget and not gui
+
+
+if __name__ == '__main__':
+    # python import_check.py [budget in seconds]
+    ok = check(budget=float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)
+    sys.exit(0 if ok else 1)
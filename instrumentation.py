@@ -0,0 +1,52 @@
+import cProfile
+import json
+import time
+from contextlib import contextmanager
+
+
+class Stats:
+    # Per-request instrumentation: accumulated time per stage, call counters and cache hits/misses
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.caches = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - start
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def cache(self, name, hit):
+        hits, misses = self.caches.get(name, (0, 0))
+        self.caches[name] = (hits + 1, misses) if hit else (hits, misses + 1)
+
+    def as_dict(self):
+        return {
+            "timings": {name: round(seconds, 6) for name, seconds in self.timings.items()},
+            "counters": dict(self.counters),
+            "caches": {name: {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 4)}
+                for name, (hits, misses) in self.caches.items()},
+        }
+
+
+def run_profiled(path, function, *args, **kwargs):
+    # Runs the function under cProfile and dumps the profile to path (.prof), or just runs it without a path
+    if path is None:
+        return function(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        profiler.dump_stats(path)
+
+
+def write_stats(path, stats):
+    with open(path, "w") as f:
+        json.dump(stats, f, indent=4)
@@ -0,0 +1,520 @@
+import bisect
+import hashlib
+import heapq
+import os
+import pickle
+from array import array
+from contextlib import nullcontext
+
+CACHE_VERSION = 11
+LOW_CO2_FOOD_THRESHOLD = 50
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compile_definition(expression, ids):
+    # (named classes, [(property, value)]) for a definition that is an intersection of named classes and hasValue
+    # restrictions, None for anything else (only the reasoner can keep those up to date)
+    from owlready2 import VALUE, And, Inverse, Restriction, ThingClass
+
+    parts = expression.Classes if isinstance(expression, And) else [expression]
+    named = []
+    restrictions = []
+    for part in parts:
+        if isinstance(part, ThingClass):
+            named.append(part._name)
+        elif isinstance(part, Restriction) and part.type == VALUE and not isinstance(part.property, Inverse):
+            value = part.value
+            if hasattr(value, "_name"):
+                if value._name not in ids: return None
+                value = ids[value._name]
+            restrictions.append((part.property._name, value))
+        else:
+            return None
+    return named, restrictions
+
+
+def expression_properties(expression):
+    # Names of the properties used anywhere in a class expression
+    from owlready2 import And, Inverse, Not, Or, Restriction
+
+    if isinstance(expression, Restriction):
+        prop = expression.property.property if isinstance(expression.property, Inverse) else expression.property
+        result = {prop._name}
+        if prop.inverse_property is not None:
+            result.add(prop.inverse_property._name)
+        return result | expression_properties(expression.value)
+    if isinstance(expression, (And, Or)):
+        return set().union(*(expression_properties(part) for part in expression.Classes))
+    if isinstance(expression, Not):
+        return expression_properties(expression.Class)
+    return set()
+
+
+class KnowledgeBase:
+    # Read-only snapshot of the ontology compiled once after the reasoner has run.
+    # Individuals are addressed by integer ids and every property is stored as two flat arrays,
+    # so the values of the individual i for a property are values[offsets[i]:offsets[i + 1]].
+    # Object properties hold individual ids, data properties hold the literals themselves.
+    # Transitive properties only hold the edges their closure is made of, closure() follows them on demand.
+
+    def __init__(self, names, class_names, members, subclasses, property_names, object_properties, offsets, values, inverses=None, definitions=None, reasoned_properties=None,
+            transitive_properties=None, asserted=None, datatypes=None, functional_properties=None, domains=None, ranges=None):
+        self.names = names  # 3: "bike"
+        self.ids = {name: i for i, name in enumerate(names)}  # "bike": 3
+        self.class_names = class_names
+        self.members = members  # "Restaurant": array of the ids of all its (inferred) instances
+        self.subclasses = subclasses  # "HealthCondition": ["HealthCondition", "COVID", ...]
+        self.property_names = property_names
+        self.object_properties = object_properties
+        self.offsets = offsets  # "co2Footprint": array of len(names) + 1 offsets
+        self.values = values  # "co2Footprint": flat array (object properties) or list (data properties)
+        self.inverses = inverses or {}  # "belongsToCity": "administrativeZoneOf", symmetric properties map to themselves
+        self.definitions = definitions or {}  # "MeetingFriendlyRestaurant": (["Restaurant"], [("hasCrowdedness", id of lowCrowdedness)])
+        self.reasoned_properties = reasoned_properties or set()  # properties used by the definitions only the reasoner handles
+        self.transitive_properties = transitive_properties or set()  # "isCheaperThan" (and the inverses of the transitive properties)
+        self.asserted = asserted or {}  # "isCheaperThan": {id: ids}, the object property values of the ontology and of the updates, without inferences
+        # Schema of the properties, the runtime updates are checked against it
+        self.datatypes = datatypes or {}  # "cost": (int,), the Python types of the values of a data property
+        self.functional_properties = functional_properties or set()  # "hasCuisine", properties with at most one value
+        self.domains = domains or {}  # "hasCuisine": ["Restaurant"], an individual with the property is in one of them
+        self.ranges = ranges or {}  # "hasCuisine": ["Cuisine"], the values of an object property are in one of them
+
+        # Derived indexes, part of the snapshot so they are rebuilt (and cached) together with it
+        self.cuisine_restaurants = self.compute_cuisine_restaurants()  # "japanese": restaurant ids
+        self.neighbourhood_city, self.city_location = self.compute_cities()
+        self.nutrient_meals = self.compute_nutrient_meals()  # "lactose": ids of the meals with a food containing it
+        self.distances = self.compute_distances()  # neighbourhood: {neighbourhood of the same city: hops}
+        self.price_order = self.compute_price_order()  # restaurant ids from the cheapest to the most expensive
+        self.price_rank = {restaurant: rank for rank, restaurant in enumerate(self.price_order)}
+        self.nutrient_bits, self.high_co2_bit, self.meal_flags = self.compute_meal_flags()  # meal: bitmask of what it contains
+        self.eligible_cache = {}  # (cuisine, profile mask): eligible meals
+
+    @classmethod
+    def from_ontology(cls, ontology, materialize=False, stats=None):
+        # materialize: complete the facts with the native materializer, for an ontology the reasoner has not seen
+        from owlready2 import FunctionalProperty, ObjectPropertyClass, SymmetricProperty, ThingClass, TransitiveProperty
+
+        individuals = list(ontology.individuals())
+        names = [individual._name for individual in individuals]
+        ids = {name: i for i, name in enumerate(names)}
+
+        classes = list(ontology.classes())
+        class_names = [ent._name for ent in classes]
+        member_sets = {}
+        subclasses = {}
+        for ent in classes:
+            member_sets[ent._name] = {ids[x._name] for x in ontology.search(type=ent) if x._name in ids}
+            subclasses[ent._name] = [x._name for x in ontology.search(subclass_of=ent)]
+
+        properties = list(ontology.properties())
+        property_names = [prop._name for prop in properties]
+        object_properties = {prop._name for prop in properties if isinstance(prop, ObjectPropertyClass)}
+        transitive_properties = {prop._name for prop in properties if TransitiveProperty in prop.is_a}
+        transitive_properties |= {prop.inverse_property._name for prop in properties if prop._name in transitive_properties and prop.inverse_property is not None}
+        functional_properties = {prop._name for prop in properties if FunctionalProperty in prop.is_a}
+        datatypes = {prop._name: tuple(datatype for datatype in prop.range if isinstance(datatype, type)) for prop in properties if prop._name not in object_properties}
+        domains = {prop._name: [cls._name for cls in prop.domain if isinstance(cls, ThingClass)] for prop in properties}
+        ranges = {prop._name: [cls._name for cls in prop.range if isinstance(cls, ThingClass)] for prop in properties if prop._name in object_properties}
+
+        per_entity = {name: [[] for _ in individuals] for name in property_names}
+        for i, individual in enumerate(individuals):
+            for prop in individual.get_properties():
+                if prop._name not in per_entity: continue
+                if prop._name in object_properties:
+                    per_entity[prop._name][i] = [ids[x._name] for x in prop[individual] if x._name in ids]
+                else:
+                    per_entity[prop._name][i] = list(prop[individual])
+
+        # Object property values asserted in the ontology itself, the inferences of a reasoner (or of a quadstore)
+        # are kept in another graph of the world
+        storids = {individual.storid: i for i, individual in enumerate(individuals)}
+        prop_names = {prop.storid: prop._name for prop in properties if prop._name in object_properties}
+        asserted = {name: {} for name in object_properties}
+        for subject, predicate, obj in ontology.graph.db.execute("SELECT s, p, o FROM objs WHERE c = ?", (ontology.graph.c,)):
+            if predicate in prop_names and subject in storids and obj in storids:
+                asserted[prop_names[predicate]].setdefault(storids[subject], []).append(storids[obj])
+
+        if not materialize:
+            # The reasoner has closed the transitive properties, only their asserted edges (in both directions) are kept
+            for prop in properties:
+                if prop._name not in transitive_properties: continue
+                edges = [list(asserted[prop._name].get(i, ())) for i in range(len(individuals))]
+                if prop.inverse_property is not None:
+                    for subject, objects in asserted[prop.inverse_property._name].items():
+                        for obj in objects:
+                            edges[obj].append(subject)
+                per_entity[prop._name] = [list(dict.fromkeys(objects)) for objects in edges]
+
+        if materialize:
+            from materializer import materialize as complete
+
+            edges = {name: {i: set(entity_values) for i, entity_values in enumerate(per_entity[name]) if entity_values} for name in object_properties}
+            literals = {name: {i: entity_values for i, entity_values in enumerate(per_entity[name]) if entity_values}
+                for name in property_names if name not in object_properties}
+            with stats.stage("materialize") if stats is not None else nullcontext():
+                derived = complete(ontology, ids, edges, literals, member_sets)
+            if stats is not None:
+                stats.count("materialized_facts", derived)
+            # The asserted values keep their order (the first one is the one most lookups read), the inferred ones follow by id
+            for name in object_properties:
+                for i, objects in edges[name].items():
+                    given = per_entity[name][i]
+                    if len(objects) > len(given):
+                        per_entity[name][i] = given + sorted(objects - set(given))
+        members = {name: array("l", sorted(ids_set)) for name, ids_set in member_sets.items()}
+
+        offsets = {}
+        values = {}
+        for name in property_names:
+            offset = array("l", [0])
+            flat = array("l") if name in object_properties else []
+            for entity_values in per_entity[name]:
+                flat.extend(entity_values)
+                offset.append(len(flat))
+            offsets[name] = offset
+            values[name] = flat
+
+        inverses = {}
+        for prop in properties:
+            if prop._name not in object_properties: continue
+            if SymmetricProperty in prop.is_a:
+                inverses[prop._name] = prop._name
+            elif prop.inverse_property is not None:
+                inverses[prop._name] = prop.inverse_property._name
+
+        # Defined classes that only need a lookup are kept up to date by the updates, the rest need the reasoner
+        definitions = {}
+        reasoned_properties = set()
+        for ent in classes:
+            for expression in ent.equivalent_to:
+                definition = compile_definition(expression, ids)
+                if definition is not None:
+                    definitions[ent._name] = definition
+                else:
+                    reasoned_properties |= expression_properties(expression)
+
+        # Same membership the reasoner gives for those definitions, also when it could not run
+        kb = cls(names, class_names, members, subclasses, property_names, object_properties, offsets, values, inverses, definitions, reasoned_properties,
+            transitive_properties, asserted, datatypes, functional_properties, domains, ranges)
+        kb.reclassify(range(len(names)))
+        return kb
+
+    def save(self, path, source_hash, reasoner):
+        # Written to a temporary file first so concurrent workers never read a half written cache
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"version": CACHE_VERSION, "hash": source_hash, "reasoner": reasoner, "kb": self}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, source_hash):
+        # Returns (kb, reasoner it was built with) if the cache was built from the same ontology file, None otherwise
+        try:
+            with open(path, "rb") as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION or cached.get("hash") != source_hash:
+            return None
+        return cached["kb"], cached["reasoner"]
+
+    def compute_distances(self, sources=None):
+        # One BFS over adjacentTo per neighbourhood, restricted to its own city since
+        # neighbourhoods of different cities are always reached with a city trip
+        distances = {}
+        for source in (self.instances("Neighbourhood") if sources is None else sources):
+            city = self.get(source, "belongsToCity")
+            hops = {source: 0}
+            frontier = [source]
+            while frontier:
+                next_frontier = []
+                for neighbourhood in frontier:
+                    for adjacent in self.get(neighbourhood, "adjacentTo"):
+                        if adjacent not in hops and self.get(adjacent, "belongsToCity") == city:
+                            hops[adjacent] = hops[neighbourhood] + 1
+                            next_frontier.append(adjacent)
+                frontier = next_frontier
+            distances[source] = hops
+        return distances
+
+    def compute_price_order(self):
+        # Topological sort (Kahn) of the isCheaperThan graph, ties are broken by id so the order is stable.
+        # Restaurants left in a cycle cannot be ordered and are appended at the expensive end.
+        restaurants = list(self.instances("Restaurant"))
+        in_degree = {restaurant: 0 for restaurant in restaurants}
+        more_expensive = {restaurant: set() for restaurant in restaurants}
+        for restaurant in restaurants:
+            for other in self.get(restaurant, "isCheaperThan"):
+                if other in in_degree and other != restaurant and other not in more_expensive[restaurant]:
+                    more_expensive[restaurant].add(other)
+                    in_degree[other] += 1
+
+        order = []
+        ready = [restaurant for restaurant in restaurants if in_degree[restaurant] == 0]
+        heapq.heapify(ready)
+        while ready:
+            restaurant = heapq.heappop(ready)
+            order.append(restaurant)
+            for other in more_expensive[restaurant]:
+                in_degree[other] -= 1
+                if in_degree[other] == 0:
+                    heapq.heappush(ready, other)
+
+        if len(order) < len(restaurants):
+            cyclic = [restaurant for restaurant in restaurants if in_degree[restaurant] > 0]
+            print(f"The isCheaperThan relation has a cycle between {[self.names[x] for x in cyclic]}, their price order is arbitrary")
+            order.extend(cyclic)
+        return order
+
+    def compute_cities(self):
+        neighbourhood_city = {n: self.get(n, "belongsToCity")[0] for n in self.instances("Neighbourhood") if len(self.get(n, "belongsToCity")) > 0}
+        city_location = {c: self.get(c, "locatedAt") for c in set(neighbourhood_city.values())}
+        return neighbourhood_city, city_location
+
+    def compute_cuisine_restaurants(self):
+        cuisine_restaurants = {}
+        for restaurant in self.instances("Restaurant"):
+            for cuisine in self.get(restaurant, "hasCuisine"):
+                cuisine_restaurants.setdefault(self.names[cuisine], array("l")).append(restaurant)
+        return cuisine_restaurants
+
+    def served_meals(self):
+        return sorted({meal for cuisine in range(len(self.names)) for meal in self.get(cuisine, "servesMeals")})
+
+    def compute_nutrient_meals(self):
+        nutrient_meals = {}
+        for meal in self.served_meals():
+            for food in self.get(meal, "hasFood"):
+                for nutrient in self.get(food, "hasNutrients"):
+                    meals = nutrient_meals.setdefault(self.names[nutrient], array("l"))
+                    if len(meals) == 0 or meals[-1] != meal:
+                        meals.append(meal)
+        return nutrient_meals
+
+    def compute_meal_flags(self):
+        # One bit per nutrient plus one for containing a food above the low CO2 threshold, so checking a meal
+        # against the health conditions and CO2 preference of a user is a single mask test
+        meal_flags = {meal: 0 for meal in self.served_meals()}
+        nutrient_bits = {}
+        for nutrient, meals in self.nutrient_meals.items():
+            nutrient_bits[nutrient] = 1 << len(nutrient_bits)
+            for meal in meals:
+                meal_flags[meal] |= nutrient_bits[nutrient]
+
+        high_co2_bit = 1 << len(nutrient_bits)
+        for meal in meal_flags:
+            for food in self.get(meal, "hasFood"):
+                co2 = self.get(food, "co2Footprint")
+                if len(co2) > 0 and co2[0] > LOW_CO2_FOOD_THRESHOLD:
+                    meal_flags[meal] |= high_co2_bit
+        return nutrient_bits, high_co2_bit, meal_flags
+
+    def restaurants_with_cuisines(self, cuisines):
+        # Union of the cuisine index, in id order like the full restaurant list
+        result = set()
+        for cuisine in cuisines:
+            result.update(self.cuisine_restaurants.get(cuisine, ()))
+        return sorted(result)
+
+    def profile_mask(self, health_conditions, low_co2_food):
+        mask = self.high_co2_bit if low_co2_food else 0
+        for condition in health_conditions:
+            mask |= self.nutrient_bits.get(condition, 0)
+        return mask
+
+    def eligible_meals(self, cuisine, mask, stats=None):
+        # Meals of a cuisine that have none of the bits of the profile mask, shared by all restaurants of the cuisine
+        key = (cuisine, mask)
+        if stats is not None:
+            stats.cache("eligible_meals", key in self.eligible_cache)
+        if key not in self.eligible_cache:
+            self.eligible_cache[key] = [meal for meal in self.get(cuisine, "servesMeals") if self.meal_flags[meal] & mask == 0]
+        return self.eligible_cache[key]
+
+    def neighbourhood_distance(self, source, target):
+        # Number of adjacentTo hops between two neighbourhoods of the same city, None if unreachable
+        hops = self.distances.get(source)
+        return hops.get(target) if hops is not None else None
+
+    def get(self, entity, prop):
+        # Values of a property for an individual id: ids for object properties, literals for data properties
+        offsets = self.offsets[prop]
+        return self.values[prop][offsets[entity]:offsets[entity + 1]]
+
+    def first(self, entity, prop):
+        return self.get(entity, prop)[0]
+
+    def closure(self, entity, prop):
+        # Values of a transitive property, its stored edges first and then the ones reached through them by id.
+        # A long isCheaperThan chain has n^2 / 2 of them, they are never stored.
+        direct = list(self.get(entity, prop))
+        reached = set()
+        stack = list(direct)
+        while stack:
+            node = stack.pop()
+            if node in reached: continue
+            reached.add(node)
+            stack.extend(self.get(node, prop))
+        return direct + sorted(reached - set(direct))
+
+    def entity_values(self, entity, closure=True):
+        # Same shape that owlready2 gives through get_properties(), but with labels instead of OWL objects.
+        # closure=False gives the stored edges of the transitive properties instead of their closure.
+        result = {}
+        for prop in self.property_names:
+            offsets = self.offsets[prop]
+            start, end = offsets[entity], offsets[entity + 1]
+            if start == end: continue
+            if prop in self.object_properties:
+                values = self.closure(entity, prop) if closure and prop in self.transitive_properties else self.values[prop][start:end]
+                result[prop] = [self.names[x] for x in values]
+            else:
+                result[prop] = self.values[prop][start:end]
+        return result
+
+    def asserted_values(self, entity):
+        # entity_values without the inferred object property values, the ones a runtime update builds on
+        result = {}
+        for prop in self.property_names:
+            if prop in self.object_properties:
+                values = [self.names[x] for x in self.asserted.get(prop, {}).get(entity, ())]
+            else:
+                values = list(self.get(entity, prop))
+            if values:
+                result[prop] = values
+        return result
+
+    def instances(self, class_name):
+        return self.members.get(class_name, array("l"))
+
+    # Updates. They change the snapshot in place (ids of the existing individuals never change) and
+    # refresh only the derived indexes that depend on what changed, see refresh()
+
+    def superclasses(self, class_name):
+        return [name for name, subclasses in self.subclasses.items() if class_name in subclasses]
+
+    def is_member(self, entity, class_name):
+        members = self.instances(class_name)
+        position = bisect.bisect_left(members, entity)
+        return position < len(members) and members[position] == entity
+
+    def set_member(self, entity, class_name, member):
+        members = self.members.setdefault(class_name, array("l"))
+        position = bisect.bisect_left(members, entity)
+        present = position < len(members) and members[position] == entity
+        if member and not present:
+            members.insert(position, entity)
+        elif not member and present:
+            del members[position]
+
+    def add_individual(self, name, class_name):
+        # New id at the end, with no values and member of the class and all its superclasses
+        entity = len(self.names)
+        self.names.append(name)
+        self.ids[name] = entity
+        for offsets in self.offsets.values():
+            offsets.append(offsets[-1])
+        for superclass in self.superclasses(class_name):
+            self.set_member(entity, superclass, True)
+        return entity
+
+    def set_values(self, entity, prop, new_values):
+        # Replaces the values of one individual in the flat arrays, the offsets after it only move if the length changes
+        offsets = self.offsets[prop]
+        start, end = offsets[entity], offsets[entity + 1]
+        old_values = list(self.values[prop][start:end])
+        self.values[prop][start:end] = array("l", new_values) if prop in self.object_properties else list(new_values)
+        delta = len(new_values) - (end - start)
+        if delta != 0:
+            offsets[entity + 1:] = array("l", (offset + delta for offset in offsets[entity + 1:]))
+        return old_values
+
+    def update(self, entity, prop, new_values, asserted=None):
+        # set_values that keeps the inverse property in sync, returns the individuals whose values changed.
+        # asserted: the values of an object property the update asserts, new_values may also keep inferred ones
+        touched = {entity}
+        if asserted is not None and prop in self.object_properties:
+            if asserted:
+                self.asserted.setdefault(prop, {})[entity] = list(asserted)
+            else:
+                self.asserted.get(prop, {}).pop(entity, None)
+        old_values = self.set_values(entity, prop, new_values)
+        inverse = self.inverses.get(prop)
+        if inverse is not None:
+            for other in set(old_values) - set(new_values):
+                self.set_values(other, inverse, [x for x in self.get(other, inverse) if x != entity])
+                touched.add(other)
+            for other in set(new_values) - set(old_values):
+                if entity not in self.get(other, inverse):
+                    self.set_values(other, inverse, list(self.get(other, inverse)) + [entity])
+                touched.add(other)
+        return touched
+
+    def remove_individual(self, entity):
+        # Clears its values and every reference to it, the id is not reused. Returns the touched individuals,
+        # the changed properties and the classes it was a member of
+        touched = {entity}
+        props = set()
+        for prop in self.property_names:
+            if len(self.get(entity, prop)) > 0:
+                touched |= self.update(entity, prop, [])
+                props.add(prop)
+        for prop in self.object_properties:
+            values = self.values[prop]
+            if entity not in values: continue
+            offsets = self.offsets[prop]
+            owners = {bisect.bisect_right(offsets, i) - 1 for i, value in enumerate(values) if value == entity}
+            for owner in owners:
+                touched |= self.update(owner, prop, [x for x in self.get(owner, prop) if x != entity])
+            props.add(prop)
+        for subjects in self.asserted.values():
+            subjects.pop(entity, None)
+            for subject in [subject for subject, objects in subjects.items() if entity in objects]:
+                subjects[subject] = [x for x in subjects[subject] if x != entity]
+        classes = {class_name for class_name in self.members if self.is_member(entity, class_name)}
+        for class_name in classes:
+            self.set_member(entity, class_name, False)
+        del self.ids[self.names[entity]]
+        return touched, props | {self.inverses[prop] for prop in props if prop in self.inverses}, classes
+
+    def reclassify(self, entities):
+        # Membership of the defined classes that are a lookup (e.g. MeetingFriendlyRestaurant), returns the changed classes
+        changed = set()
+        for class_name, (named, restrictions) in self.definitions.items():
+            for entity in entities:
+                member = self.names[entity] in self.ids and all(self.is_member(entity, name) for name in named) and \
+                    all(value in self.get(entity, prop) for prop, value in restrictions)
+                if member != self.is_member(entity, class_name):
+                    self.set_member(entity, class_name, member)
+                    changed.add(class_name)
+        return changed
+
+    def refresh(self, props, classes, touched):
+        # Recomputes the derived indexes that depend on the changed properties or class memberships.
+        # Distances are only recomputed for the cities of the touched neighbourhoods (before and after the change).
+        if props & {"belongsToCity", "administrativeZoneOf", "locatedAt", "adjacentTo"} or "Neighbourhood" in classes:
+            cities = {self.neighbourhood_city.get(entity) for entity in touched}
+            self.neighbourhood_city, self.city_location = self.compute_cities()
+            cities |= {self.neighbourhood_city.get(entity) for entity in touched}
+            stale = {n for n in self.distances if n in touched or self.neighbourhood_city.get(n) in cities}
+            for neighbourhood in stale:
+                del self.distances[neighbourhood]
+            sources = [n for n in self.instances("Neighbourhood") if n in touched or self.neighbourhood_city.get(n) in cities]
+            self.distances.update(self.compute_distances(sources))
+        if "hasCuisine" in props or "Restaurant" in classes:
+            self.cuisine_restaurants = self.compute_cuisine_restaurants()
+        if "isCheaperThan" in props or "Restaurant" in classes:
+            self.price_order = self.compute_price_order()
+            self.price_rank = {restaurant: rank for rank, restaurant in enumerate(self.price_order)}
+        if props & {"servesMeals", "hasFood", "hasNutrients", "co2Footprint"}:
+            self.nutrient_meals = self.compute_nutrient_meals()
+            self.nutrient_bits, self.high_co2_bit, self.meal_flags = self.compute_meal_flags()
+        if props & {"servesMeals", "hasFood", "hasNutrients", "co2Footprint", "hasCuisine"}:
+            self.eligible_cache = {}
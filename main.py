@@ -1,26 +1,95 @@
 import sys
 import agent
-import form
+import batch
+import server
 
 def main():
     args = sys.argv[1:]
 
+    # '-top k' keeps only the best k options
+    top_k = None
+    if "-top" in args:
+        position = args.index("-top")
+        try:
+            top_k = int(args[position + 1])
+        except (IndexError, ValueError):
+            print("Please check the format: '-top k'")
+            return
+        args = args[:position] + args[position + 2:]
+
+    # '-profile file' writes the timings and counters of the request as JSON, or a cProfile dump for a .prof file
+    profile_path = None
+    if "-profile" in args:
+        position = args.index("-profile")
+        if position + 1 >= len(args):
+            print("Please check the format: '-profile file'")
+            return
+        profile_path = args[position + 1]
+        args = args[:position] + args[position + 2:]
+
+    # '-reasoner hermit' runs HermiT (needs Java) instead of the native materializer
+    reasoner = "native"
+    if "-reasoner" in args:
+        position = args.index("-reasoner")
+        if position + 1 >= len(args) or args[position + 1] not in ("native", "hermit"):
+            print("Please check the format: '-reasoner native' or '-reasoner hermit'")
+            return
+        reasoner = args[position + 1]
+        args = args[:position] + args[position + 2:]
+
+    # '-quadstore file' keeps the reasoned ontology in an SQLite quadstore and selects the candidates with SPARQL
+    quadstore = None
+    if "-quadstore" in args:
+        position = args.index("-quadstore")
+        if position + 1 >= len(args):
+            print("Please check the format: '-quadstore file'")
+            return
+        quadstore = args[position + 1]
+        args = args[:position] + args[position + 2:]
+
+    # '-routing transport' scores the duration with the travel time of each transport instead of the hops
+    routing = "hops"
+    if "-routing" in args:
+        position = args.index("-routing")
+        if position + 1 >= len(args) or args[position + 1] not in ("hops", "transport"):
+            print("Please check the format: '-routing hops' or '-routing transport'")
+            return
+        routing = args[position + 1]
+        args = args[:position] + args[position + 2:]
+
     if len(args) != 2:
         print("If you want to specify an already existing scenario, use '-scenario n' option. Opening form...")
+        # The form pulls in the GUI stack, so it is only imported when it is actually opened
+        import form
         scenario_number = form.execute_form()
         if scenario_number is None:
             print("The form was not completed successfully")
-        a = agent.Agent()
-        a.reasoning(int(scenario_number))
+        a = agent.Agent(reasoner=reasoner, quadstore=quadstore, routing=routing)
+        a.reasoning(int(scenario_number), top_k, profile_path)
     else:
         if args[0] == "-scenario":
             try:
-                a = agent.Agent()
-                a.reasoning(int(args[1]))
+                a = agent.Agent(reasoner=reasoner, quadstore=quadstore, routing=routing)
+                a.reasoning(int(args[1]), top_k, profile_path)
             except Exception:
                 print("Please introduce an existing scenario number")
+        elif args[0] == "-batch":
+            try:
+                start, stop = batch.parse_range(args[1])
+            except ValueError:
+                print("Please check the format: '-batch all', '-batch n' or '-batch start-stop'")
+                return
+            count = batch.run_batch(start, stop, top_k=top_k, quadstore_path=quadstore, routing=routing, reasoner=reasoner)
+            print(f"{count} scenarios evaluated, results written to batch_output.jsonl")
+        elif args[0] == "-server":
+            try:
+                port = int(args[1])
+            except ValueError:
+                print("Please introduce a valid port number")
+                return
+            server.serve(port, quadstore_path=quadstore, routing=routing, reasoner=reasoner)
         else:
-            print("Please check the format: '-scenario n'")
+            print("Please check the format: '-scenario n', '-batch all' or '-server port'")
 
 if __name__ == '__main__':
     main()
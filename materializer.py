@@ -0,0 +1,408 @@
+import json
+import os
+import shutil
+import sys
+
+# In-process replacement of HermiT for the inferences the agent reads from the knowledge base: inverse, symmetric,
+# transitive and sub properties, domains and ranges, subclasses and the defined classes (BigCity,
+# MeetingFriendlyRestaurant). The facts are closed with a semi-naive fixpoint: every rule is only applied to the
+# facts derived in the previous round, joined with all the known ones, until nothing new is derived.
+# Transitive properties are not closed: their edges are completed like the others (inverses, sub properties) and
+# the knowledge base follows them on demand (KnowledgeBase.closure), as do the definitions that read them here.
+# Class definitions are evaluated on the known facts. Like HermiT, two individuals are only different when the
+# ontology entails it: declared different (AllDifferent), different values of a functional data property (the
+# nHabitants of two neighbourhoods) or members of disjoint classes. A min cardinality above 1 only counts values
+# that are pairwise different.
+# Restrictions that need the absence of facts (only, max, exactly, complements) never make an individual a member.
+
+RELEVANT_PROPERTIES = ["adjacentTo", "belongsToCity", "administrativeZoneOf", "hasEstablishmentAt", "hasRestaurant", "servesMeals", "isCheaperThan"]
+RELEVANT_CLASSES = ["BigCity", "City", "Restaurant", "MeetingFriendlyRestaurant", "Neighbourhood", "Meal", "Cuisine"]
+
+
+class Materializer:
+
+    def __init__(self, ontology, ids, edges, literals, members):
+        # edges: object property -> {subject id: set of object ids}, literals: data property -> {subject id: values},
+        # members: class name -> set of ids. edges and members are completed in place by run()
+        from owlready2 import DataPropertyClass, FunctionalProperty, ObjectPropertyClass, OneOf, SymmetricProperty, ThingClass, TransitiveProperty
+
+        self.ids = ids
+        self.edges = edges
+        self.literals = literals
+        self.members = members
+        self.reverse = {prop: {} for prop in edges}  # object property -> {object id: set of subject ids}
+        for prop, subjects in edges.items():
+            for subject, objects in subjects.items():
+                for obj in objects:
+                    self.reverse[prop].setdefault(obj, set()).add(subject)
+
+        self.inverse = {}
+        self.transitive = set()
+        self.super_properties = {}
+        self.domains = {}
+        self.ranges = {}
+        for prop in ontology.properties():
+            name = prop._name
+            if not isinstance(prop, ObjectPropertyClass) or name not in edges: continue
+            if SymmetricProperty in prop.is_a:
+                self.inverse[name] = name
+            elif prop.inverse_property is not None and prop.inverse_property._name in edges:
+                self.inverse[name] = prop.inverse_property._name
+            if TransitiveProperty in prop.is_a:
+                self.transitive.add(name)
+                if name in self.inverse:
+                    self.transitive.add(self.inverse[name])
+            self.super_properties[name] = [p._name for p in prop.is_a if isinstance(p, ObjectPropertyClass) and p._name in edges]
+            self.domains[name] = [c._name for c in prop.domain if isinstance(c, ThingClass)]
+            self.ranges[name] = [c._name for c in prop.range if isinstance(c, ThingClass)]
+
+        self.superclasses = {}
+        self.enumerations = []  # (class name, ids of the individuals it enumerates)
+        self.definitions = []  # (class name, expression, properties it reads, classes it reads)
+        for ent in ontology.classes():
+            parents = [c._name for c in ent.is_a if isinstance(c, ThingClass) and c._name != "Thing"]
+            for expression in ent.equivalent_to:
+                if isinstance(expression, OneOf):
+                    self.enumerations.append((ent._name, [ids[x._name] for x in expression.instances if hasattr(x, "_name") and x._name in ids]))
+                    continue
+                parents += self.named_conjuncts(expression)
+                props, classes = self.dependencies(expression)
+                self.definitions.append((ent._name, expression, props, classes))
+            self.superclasses[ent._name] = parents
+
+        self.different = set()  # frozenset({id, id}) of the individuals declared different
+        for group in ontology.different_individuals():
+            entities = [ids[x._name] for x in group.entities if hasattr(x, "_name") and x._name in ids]
+            self.different.update(frozenset((a, b)) for position, a in enumerate(entities) for b in entities[position + 1:])
+        self.functional_literals = [prop._name for prop in ontology.properties()
+            if isinstance(prop, DataPropertyClass) and FunctionalProperty in prop.is_a and prop._name in literals]
+        self.disjoint = [[c._name for c in group.entities if isinstance(c, ThingClass)] for group in ontology.disjoint_classes()]
+
+        self.new_edges = []
+        self.new_members = []
+        self.derived = 0
+
+    def named_conjuncts(self, expression):
+        from owlready2 import And, ThingClass
+
+        parts = expression.Classes if isinstance(expression, And) else [expression]
+        return [part._name for part in parts if isinstance(part, ThingClass)]
+
+    def dependencies(self, expression):
+        # Properties and named classes a class expression reads (the classes also inside fillers)
+        from owlready2 import And, Inverse, Not, Or, Restriction, ThingClass
+
+        if isinstance(expression, ThingClass):
+            return set(), {expression._name}
+        if isinstance(expression, Restriction):
+            prop = expression.property.property if isinstance(expression.property, Inverse) else expression.property
+            props, classes = self.dependencies(expression.value)
+            return props | {prop._name}, classes
+        if isinstance(expression, (And, Or)):
+            props, classes = set(), set()
+            for part in expression.Classes:
+                part_props, part_classes = self.dependencies(part)
+                props |= part_props
+                classes |= part_classes
+            return props, classes
+        if isinstance(expression, Not):
+            return self.dependencies(expression.Class)
+        return set(), set()
+
+    def add_edge(self, subject, prop, obj):
+        objects = self.edges[prop].setdefault(subject, set())
+        if obj not in objects:
+            objects.add(obj)
+            self.reverse[prop].setdefault(obj, set()).add(subject)
+            self.new_edges.append((subject, prop, obj))
+
+    def add_member(self, entity, class_name):
+        members = self.members.setdefault(class_name, set())
+        if entity not in members:
+            members.add(entity)
+            self.new_members.append((entity, class_name))
+
+    def run(self):
+        # Every asserted fact is new in the first round
+        self.new_edges = [(subject, prop, obj) for prop, subjects in self.edges.items() for subject, objects in subjects.items() for obj in objects]
+        self.new_members = [(entity, class_name) for class_name, members in self.members.items() for entity in members]
+        asserted = len(self.new_edges) + len(self.new_members)
+        for class_name, entities in self.enumerations:
+            for entity in entities:
+                self.add_member(entity, class_name)
+        while self.new_edges or self.new_members:
+            edges, self.new_edges = self.new_edges, []
+            members, self.new_members = self.new_members, []
+
+            for subject, prop, obj in edges:
+                if prop in self.inverse:
+                    self.add_edge(obj, self.inverse[prop], subject)
+                for super_property in self.super_properties.get(prop, ()):
+                    self.add_edge(subject, super_property, obj)
+                for class_name in self.domains.get(prop, ()):
+                    self.add_member(subject, class_name)
+                for class_name in self.ranges.get(prop, ()):
+                    self.add_member(obj, class_name)
+            for entity, class_name in members:
+                for superclass in self.superclasses.get(class_name, ()):
+                    self.add_member(entity, superclass)
+
+            # Individuals whose definitions may hold now: the subjects of the new edges of a property a definition
+            # reads, the new members of a class it reads and whoever points to them through one of its properties
+            for class_name, expression, props, classes in self.definitions:
+                candidates = set()
+                for subject, prop, obj in edges:
+                    if prop in props:
+                        candidates.update((subject, obj))
+                for entity, member_class in members:
+                    if member_class in classes:
+                        candidates.add(entity)
+                        for prop in props:
+                            candidates.update(self.reverse.get(prop, {}).get(entity, ()))
+                for entity in candidates:
+                    if entity not in self.members.get(class_name, ()) and self.holds(entity, expression):
+                        self.add_member(entity, class_name)
+
+        self.derived = sum(len(objects) for subjects in self.edges.values() for objects in subjects.values()) + \
+            sum(len(members) for members in self.members.values()) - asserted
+        return self.derived
+
+    def reachable(self, entity, prop, edges):
+        # Closure of a transitive property from entity
+        result = set()
+        stack = list(edges.get(entity, ()))
+        while stack:
+            node = stack.pop()
+            if node in result: continue
+            result.add(node)
+            stack.extend(edges.get(node, ()))
+        return result
+
+    def values(self, entity, prop):
+        from owlready2 import Inverse
+
+        if isinstance(prop, Inverse):
+            name = prop.property._name
+            if name in self.transitive:
+                return self.reachable(entity, name, self.reverse.get(name, {}))
+            return self.reverse.get(name, {}).get(entity, ())
+        if prop._name in self.transitive:
+            return self.reachable(entity, prop._name, self.edges[prop._name])
+        if prop._name in self.edges:
+            return self.edges[prop._name].get(entity, ())
+        return self.literals.get(prop._name, {}).get(entity, ())
+
+    def holds(self, entity, expression):
+        from owlready2 import EXACTLY, MAX, MIN, ONLY, SOME, VALUE, And, OneOf, Or, Restriction, ThingClass
+
+        if isinstance(expression, ThingClass):
+            return entity in self.members.get(expression._name, ())
+        if isinstance(expression, And):
+            return all(self.holds(entity, part) for part in expression.Classes)
+        if isinstance(expression, Or):
+            return any(self.holds(entity, part) for part in expression.Classes)
+        if isinstance(expression, OneOf):
+            return any(hasattr(x, "_name") and self.ids.get(x._name) == entity for x in expression.instances)
+        if isinstance(expression, Restriction):
+            values = self.values(entity, expression.property)
+            if expression.type == VALUE:
+                value = expression.value
+                return (self.ids.get(value._name) if hasattr(value, "_name") else value) in values
+            if expression.type == SOME:
+                return any(self.satisfies(value, expression.value) for value in values)
+            if expression.type == MIN:
+                filler = expression.value
+                matching = [value for value in values if filler is None or self.satisfies(value, filler)]
+                if len(matching) < expression.cardinality:
+                    return False
+                if expression.property._name not in self.edges:
+                    return len(set(matching)) >= expression.cardinality  # different literals are always different
+                return self.has_different(sorted(set(matching)), expression.cardinality)
+            if expression.type in (ONLY, MAX, EXACTLY):
+                return False
+        return False
+
+    def are_different(self, a, b):
+        if frozenset((a, b)) in self.different:
+            return True
+        for prop in self.functional_literals:
+            values_a, values_b = self.literals[prop].get(a, ()), self.literals[prop].get(b, ())
+            if values_a and values_b and set(values_a).isdisjoint(values_b):
+                return True
+        for group in self.disjoint:
+            classes_a = [c for c in group if a in self.members.get(c, ())]
+            classes_b = [c for c in group if b in self.members.get(c, ())]
+            if any(class_a != class_b for class_a in classes_a for class_b in classes_b):
+                return True
+        return False
+
+    def has_different(self, values, n, chosen=()):
+        # True if n of the individuals are pairwise different (backtracking, the values of a restriction are few)
+        if len(chosen) >= n:
+            return True
+        for position, value in enumerate(values):
+            if all(self.are_different(value, other) for other in chosen) and self.has_different(values[position + 1:], n, chosen + (value,)):
+                return True
+        return False
+
+    def satisfies(self, value, filler):
+        # value is an individual id (object properties) or a literal (data properties)
+        from owlready2 import ConstrainedDatatype, Thing
+
+        if filler is None or filler is Thing:
+            return True
+        if isinstance(filler, type) and not hasattr(filler, "namespace"):
+            return isinstance(value, filler) and not (filler is int and isinstance(value, bool))
+        if isinstance(filler, ConstrainedDatatype):
+            if not self.satisfies(value, filler.base_datatype):
+                return False
+            checks = [("min_inclusive", lambda bound: value >= bound), ("min_exclusive", lambda bound: value > bound),
+                ("max_inclusive", lambda bound: value <= bound), ("max_exclusive", lambda bound: value < bound)]
+            return all(check(getattr(filler, facet)) for facet, check in checks if getattr(filler, facet, None) is not None)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return self.holds(value, filler)
+        return False
+
+
+def materialize(ontology, ids, edges, literals, members):
+    # Completes edges and members in place, returns the number of derived facts
+    return Materializer(ontology, ids, edges, literals, members).run()
+
+
+def java_executable():
+    # Java that runs HermiT: the one of JAVA_HOME (java.exe on Windows) or else the one on the PATH, None without Java
+    java_home = os.getenv('JAVA_HOME')
+    if java_home is not None:
+        java = os.path.join(java_home, "bin", "java.exe" if os.name == "nt" else "java")
+        if os.path.isfile(java):
+            return java
+    return shutil.which("java")
+
+
+def hermit_fallback():
+    # Reasoner recorded when HermiT was asked for and could not run: the materializer, with the Java it failed with,
+    # so its result is trusted until Java changes
+    return f"native (hermit with {java_executable()})"
+
+
+def run_hermit(world):
+    # Runs HermiT on the world, its inferences go to the http://inferrences/ ontology so the graph of the .owl file
+    # keeps the asserted facts only. Raises FileNotFoundError without Java and OwlReadyJavaError if HermiT fails.
+    import owlready2
+
+    java = java_executable()
+    if java is None:
+        raise FileNotFoundError("No Java found in JAVA_HOME nor in the PATH")
+    owlready2.JAVA_EXE = java
+    owlready2.sync_reasoner(world, infer_property_values=True, debug=0)
+
+
+def load_knowledge_base(path, reasoner):
+    # Knowledge base of the ontology in its own world, reasoned with "native" or "hermit"
+    import owlready2
+    from knowledge_base import KnowledgeBase
+
+    world = owlready2.World()
+    ontology = world.get_ontology(f"file://{os.path.abspath(path)}").load()
+    if reasoner == "hermit":
+        run_hermit(world)
+        return KnowledgeBase.from_ontology(ontology), ontology
+    return KnowledgeBase.from_ontology(ontology, materialize=True), ontology
+
+
+def facts(kb, props=RELEVANT_PROPERTIES, classes=RELEVANT_CLASSES):
+    # The inferred facts the agent reads, by name so knowledge bases of different worlds can be compared
+    result = set()
+    for prop in props:
+        if prop not in kb.offsets: continue
+        values = kb.closure if prop in kb.transitive_properties else kb.get
+        for entity, name in enumerate(kb.names):
+            result.update((name, prop, kb.names[x]) for x in values(entity, prop))
+    for class_name in classes:
+        result.update((kb.names[x], "type", class_name) for x in kb.instances(class_name))
+    return result
+
+
+def owlready_facts(ontology, props=RELEVANT_PROPERTIES):
+    # Closure of the properties computed by owlready2 itself (INDIRECT_ values follow inverse, symmetric,
+    # transitive and sub properties), used as reference when Java is not available. Classes are not compared.
+    result = set()
+    for individual in ontology.individuals():
+        for prop in props:
+            if ontology[prop] is None: continue
+            values = getattr(individual, f"INDIRECT_{prop}")  # a single value (or None) for functional properties
+            values = values if isinstance(values, list) else [] if values is None else [values]
+            result.update((individual._name, prop, x._name) for x in values if hasattr(x, "_name"))
+    return result
+
+
+def reference_path(path):
+    return os.path.splitext(path)[0] + ".hermit.json"
+
+
+def write_reference(path="infoiag_project_2021_group1.owl"):
+    # Facts HermiT infers for the ontology (needs Java), stored next to it so verify() can run without Java
+    from knowledge_base import file_hash
+
+    reference = facts(load_knowledge_base(path, "hermit")[0])
+    with open(reference_path(path), "w") as f:
+        json.dump({"hash": file_hash(path), "facts": [" ".join(fact) for fact in sorted(reference)]}, f, indent=1)
+    print(f"{len(reference)} HermiT facts written to {reference_path(path)}")
+
+
+def load_reference(path):
+    # Facts of the stored HermiT reference, None if there is none for this version of the ontology
+    from knowledge_base import file_hash
+
+    try:
+        with open(reference_path(path)) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if stored.get("hash") != file_hash(path):
+        print(f"{reference_path(path)} was written for another version of {path}, run 'python materializer.py --write-reference' with Java")
+        return None
+    return {tuple(fact.split(" ")) for fact in stored["facts"]}
+
+
+def verify(path="infoiag_project_2021_group1.owl"):
+    # Compares the native materialization with HermiT, with the stored HermiT facts when Java is not installed or
+    # HermiT fails, or with owlready2's closure of the properties when there are none. Prints the differences and returns True when
+    # there are none.
+    from owlready2 import OwlReadyJavaError
+
+    kb, ontology = load_knowledge_base(path, "native")
+    native = facts(kb)
+    reference = None
+    if java_executable() is not None:
+        try:
+            reference = facts(load_knowledge_base(path, "hermit")[0])
+            reference_name = "HermiT"
+        except (OSError, OwlReadyJavaError) as e:
+            print(f"HermiT could not run, using the stored facts: {str(e).strip()}")
+    if reference is None and load_reference(path) is not None:
+        reference_name = f"HermiT ({reference_path(path)})"
+        reference = load_reference(path)
+    elif reference is None:
+        reference_name = "owlready2 (no Java, properties only)"
+        reference = owlready_facts(ontology)
+        native = facts(kb, classes=[])
+
+    missing = sorted(reference - native)
+    extra = sorted(native - reference)
+    print(f"{len(native)} native facts, {len(reference)} from {reference_name}")
+    for fact in missing:
+        print(f"\tmissing: {fact}")
+    for fact in extra:
+        print(f"\textra: {fact}")
+    return not missing and not extra
+
+
+if __name__ == '__main__':
+    # python materializer.py [ontology.owl] [--write-reference]
+    args = [arg for arg in sys.argv[1:] if arg != "--write-reference"]
+    if "--write-reference" in sys.argv[1:]:
+        write_reference(*args[:1])
+        sys.exit(0)
+    ok = verify(*args[:1])
+    sys.exit(0 if ok else 1)
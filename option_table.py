@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class OptionTable:
+    # Ranked options stored by columns: knowledge base ids for the labels plus the CO2 and utility values, about
+    # 40 bytes per option. An option only becomes a dict of strings when it is read (indexing, iteration or
+    # to_list() when serializing), so a large grid can be ranked and paged through without building all of them.
+
+    def __init__(self, names, transports, transport, restaurant, city, neighbourhood, meal, co2, utility):
+        self.names = names  # the names of the knowledge base, indexed by id
+        self.transports = transports  # transport names, the transport column holds positions in it
+        self.transport = np.asarray(transport, dtype=np.int8)
+        self.restaurant = np.asarray(restaurant, dtype=np.int32)
+        self.city = np.asarray(city, dtype=np.int32)
+        self.neighbourhood = np.asarray(neighbourhood, dtype=np.int32)
+        self.meal = np.asarray(meal, dtype=np.int32)
+        self.co2 = np.asarray(co2) if len(co2) > 0 else np.zeros(0)  # integer when every footprint is, like the sums it comes from
+        self.utility = np.asarray(utility, dtype=np.float64)
+
+    @classmethod
+    def empty(cls, names, transports):
+        return cls(names, transports, [], [], [], [], [], [], [])
+
+    def option(self, i):
+        return {"transport": self.transports[self.transport[i]], "restaurant": self.names[self.restaurant[i]], "city": self.names[self.city[i]],
+            "neighbourhood": self.names[self.neighbourhood[i]], "meal": self.names[self.meal[i]], "co2": self.co2[i].item(), "utility": self.utility[i].item()}
+
+    def select(self, rows):
+        return OptionTable(self.names, self.transports, self.transport[rows], self.restaurant[rows], self.city[rows], self.neighbourhood[rows],
+            self.meal[rows], self.co2[rows], self.utility[rows])
+
+    def to_list(self):
+        return [self.option(i) for i in range(len(self))]
+
+    def nbytes(self):
+        return sum(column.nbytes for column in (self.transport, self.restaurant, self.city, self.neighbourhood, self.meal, self.co2, self.utility))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.select(index)
+        return self.option(range(len(self))[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.option(i)
+
+    def __len__(self):
+        return len(self.utility)
+
+    def __eq__(self, other):
+        return self.to_list() == list(other)
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def skyline(points, block_size=256):
+    # Positions (increasing) of the rows of points that no other row dominates, larger being better in every column.
+    # Equal rows do not dominate each other, so they are all kept or all dropped and only the distinct rows are
+    # compared. A dominating row has a larger sum, so after sorting by decreasing sum a row can only be dominated by
+    # the rows before it (sort-filter-skyline): rows are checked by blocks against the skyline found so far and
+    # against the rest of their block.
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.int64)
+    distinct, inverse = np.unique(points, axis=0, return_inverse=True)
+    order = np.argsort(-distinct.sum(axis=1), kind="stable")
+    kept = np.zeros(len(distinct), dtype=bool)
+    window = np.zeros((0, points.shape[1]))
+    for start in range(0, len(order), block_size):
+        block = order[start:start + block_size]
+        candidates = distinct[block]
+        dominated = np.zeros(len(block), dtype=bool)
+        for others in (window, candidates):
+            if len(others) == 0: continue
+            at_least = np.all(others[None, :, :] >= candidates[:, None, :], axis=2)
+            better = np.any(others[None, :, :] > candidates[:, None, :], axis=2)
+            dominated |= np.any(at_least & better, axis=1)
+        kept[block[~dominated]] = True
+        window = np.vstack([window, candidates[~dominated]])
+    return np.flatnonzero(kept[inverse.ravel()])
+
+
+class ParetoFrontier:
+    # The options of a request that are not dominated on the terms of the utility (transport CO2 score, cost
+    # score, duration, normalized food utility) nor on the total CO2. Every utility is a weighted sum of those
+    # terms with non-negative weights, so the best option for any weights is on the frontier and a new set of
+    # weights only has to rank these options (Agent.rank_frontier) instead of the whole grid.
+
+    def __init__(self, table, terms, grid_size):
+        self.table = table  # OptionTable of the frontier in enumeration order, utility under the weights of the request
+        self.terms = terms  # (len(table), 4) array with the terms of each option
+        self.grid_size = grid_size  # number of options the frontier was taken from
+
+    def __len__(self):
+        return len(self.table)
@@ -0,0 +1,185 @@
+import os
+import sys
+import threading
+
+from knowledge_base import LOW_CO2_FOOD_THRESHOLD
+
+# Layout of the stored facts, a store with another version is rebuilt
+STORE_VERSION = 2
+# Ontology of the inferred facts, the one HermiT writes to, so the graph of the .owl file only has the asserted ones
+INFERRED_IRI = "http://inferrences/"
+
+
+class QuadStore:
+    # The reasoned ontology kept in an owlready2 SQLite quadstore on disk. It is only rebuilt when the .owl file
+    # changes, the other runs (and every batch worker) open the same file without parsing the ontology, and the
+    # candidate restaurants and meals of a request are selected by SPARQL queries so SQLite does the joins.
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.world = None
+        self.pid = None
+        self.queries = {}  # shape of the filters: prepared query
+
+    def open(self):
+        # An SQLite connection can not be used after a fork, each process opens its own
+        import owlready2
+
+        if self.world is None or self.pid != os.getpid():
+            self.world = owlready2.World(filename=self.path, exclusive=False)
+            self.pid = os.getpid()
+            self.queries = {}
+            with self.world.graph.db:
+                self.world.graph.db.execute("CREATE TABLE IF NOT EXISTS agent_source (hash TEXT, reasoner TEXT, iri TEXT)")
+        return self.world
+
+    def source(self):
+        # (hash of the .owl file, reasoner, ontology IRI) of the stored facts, None for an empty or outdated store
+        db = self.open().graph.db
+        if db.execute("PRAGMA user_version").fetchone()[0] != STORE_VERSION:
+            return None
+        return db.execute("SELECT hash, reasoner, iri FROM agent_source").fetchone()
+
+    def ontology(self):
+        return self.open().get_ontology(self.source()[2])
+
+    def load(self, owl_path, current):
+        # Ontology of the store when it is current, otherwise the store is emptied and the .owl file loaded into it
+        if current:
+            return self.ontology().load()
+        self.world.close()
+        self.world = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        return self.open().get_ontology(f"file://{os.path.abspath(owl_path)}").load()
+
+    def save(self, ontology, kb, source_hash, reasoner):
+        # Adds the inferred facts of the compiled knowledge base that are not in the store yet, under the inferred
+        # ontology. The facts are streamed into a temporary table and SQLite keeps the missing ones, so the triples of
+        # the store are never read into memory.
+        from owlready2 import rdf_type
+
+        world = self.open()
+        db = world.graph.db
+        inferred = world.get_ontology(INFERRED_IRI)
+        storids = [None if ontology[name] is None else ontology[name].storid for name in kb.names]
+
+        def facts():
+            for prop in kb.object_properties:
+                predicate = ontology[prop].storid
+                for entity, subject in enumerate(storids):
+                    if subject is None: continue
+                    for value in kb.get(entity, prop):
+                        yield subject, predicate, storids[value]
+            for class_name in kb.members:
+                cls = ontology[class_name].storid
+                for entity in kb.instances(class_name):
+                    if storids[entity] is not None:
+                        yield storids[entity], rdf_type, cls
+
+        with db:
+            db.execute("CREATE TEMP TABLE agent_facts (s INTEGER, p INTEGER, o INTEGER)")
+            db.executemany("INSERT INTO agent_facts VALUES (?, ?, ?)", facts())
+            # "+objs.o" keeps SQLite on the (s, p) index: the (o, p) one has every member of a class for rdf:type
+            added = db.execute("""INSERT INTO objs SELECT DISTINCT ?, s, p, o FROM agent_facts AS fact
+                WHERE NOT EXISTS (SELECT 1 FROM objs WHERE objs.s = fact.s AND objs.p = fact.p AND +objs.o = fact.o)""", (inferred.graph.c,)).rowcount
+            db.execute("DROP TABLE agent_facts")
+            db.execute("DELETE FROM agent_source")
+            db.execute("INSERT INTO agent_source VALUES (?, ?, ?)", (source_hash, reasoner, ontology.base_iri))
+            db.execute(f"PRAGMA user_version = {STORE_VERSION}")
+        world.save()
+        return added
+
+    def query(self, shape):
+        # Prepared SPARQL query for a number of cuisines, avoided cuisines, excluded crowdedness values and nutrients
+        # (the parameters, in that order) and the CO2 preference. Rows are (restaurant, eligible meal).
+        if shape not in self.queries:
+            cuisines, avoided, crowdedness, nutrients, low_co2 = shape
+            filters = []
+            if cuisines > 0:
+                filters.append(f"FILTER (?cuisine IN ({', '.join(['??'] * cuisines)}))")
+            if avoided > 0:
+                filters.append(f"FILTER NOT EXISTS {{ ?restaurant :hasCuisine ?avoided . FILTER (?avoided IN ({', '.join(['??'] * avoided)})) }}")
+            if crowdedness > 0:
+                filters.append(f"FILTER NOT EXISTS {{ ?restaurant :hasCrowdedness ?crowdedness . FILTER (?crowdedness IN ({', '.join(['??'] * crowdedness)})) }}")
+            if nutrients > 0:
+                filters.append(f"FILTER NOT EXISTS {{ ?meal :hasFood ?food . ?food :hasNutrients ?nutrient . FILTER (?nutrient IN ({', '.join(['??'] * nutrients)})) }}")
+            if low_co2:
+                filters.append(f"FILTER NOT EXISTS {{ ?meal :hasFood ?food2 . ?food2 :co2Footprint ?co2 . FILTER (?co2 > {LOW_CO2_FOOD_THRESHOLD}) }}")
+            self.queries[shape] = self.world.prepare_sparql(f"""PREFIX : <{self.source()[2]}>
+                SELECT ?restaurant ?meal WHERE {{
+                    ?restaurant a :Restaurant ; :hasCuisine ?cuisine .
+                    ?cuisine :servesMeals ?meal .
+                    {' '.join(filters)}
+                }}""")
+        return self.queries[shape]
+
+    def candidates(self, cuisines, avoided, crowdedness, nutrients, low_co2):
+        # {restaurant name: set of eligible meal names} of the restaurants with one of the cuisines (any when empty),
+        # without an avoided cuisine nor an excluded crowdedness. Names unknown to the store are ignored.
+        with self.lock:
+            ontology = self.ontology()
+            groups = [[entity for entity in (ontology[name] for name in names) if entity is not None] for names in (cuisines, avoided, crowdedness, nutrients)]
+            query = self.query(tuple(len(group) for group in groups) + (low_co2,))
+            result = {}
+            for restaurant, meal in query.execute([entity for group in groups for entity in group]):
+                result.setdefault(restaurant.name, set()).add(meal.name)
+            return result
+
+    def has_restaurants(self, cuisines):
+        # True if a restaurant has one of the cuisines
+        with self.lock:
+            ontology = self.ontology()
+            cuisines = [entity for entity in (ontology[name] for name in cuisines) if entity is not None]
+            if len(cuisines) == 0:
+                return False
+            shape = ("any", len(cuisines))
+            if shape not in self.queries:
+                self.queries[shape] = self.world.prepare_sparql(f"""PREFIX : <{self.source()[2]}>
+                    SELECT ?restaurant WHERE {{ ?restaurant a :Restaurant ; :hasCuisine ?cuisine . FILTER (?cuisine IN ({', '.join(['??'] * len(cuisines))})) }} LIMIT 1""")
+            return len(list(self.queries[shape].execute(cuisines))) > 0
+
+
+def verify(store_path, path="infoiag_project_2021_group1.owl"):
+    # Compares the candidate restaurants and meals selected by the quadstore with the ones of the in-memory knowledge
+    # base, for every stored scenario as it is, with each cuisine avoided and with each crowdedness preference.
+    # Prints the differences and returns True when there are none.
+    from agent import Agent
+    from request_context import RequestContext
+    from scenario_store import ScenarioStore
+
+    memory = Agent(path)
+    stored = Agent(path, quadstore=store_path)
+    cuisines = sorted(memory.kb.names[cuisine] for cuisine in memory.kb.instances("Cuisine"))
+    with ScenarioStore() as scenarios:
+        rows = scenarios.scenarios()
+    checked = 0
+    differences = 0
+    for number, row in rows:
+        context = RequestContext()
+        health_conditions, _, preferred_cuisines, avoid_cuisines, low_co2, _, restaurant_crowdedness, _ = memory.process_request(context, row, False)
+        variants = [(avoid_cuisines, restaurant_crowdedness)]
+        variants += [([cuisine], restaurant_crowdedness) for cuisine in cuisines]
+        variants += [(avoid_cuisines, [crowdedness]) for crowdedness in ("low", "high")]
+        for avoided, crowdedness in variants:
+            results = []
+            for agent in (memory, stored):
+                restaurants = agent.iter_restaurants(RequestContext(), preferred_cuisines, avoided, health_conditions, low_co2, crowdedness)
+                results.append({agent.kb.names[restaurant]: sorted(agent.kb.names[meal] for meal in meals) for restaurant, meals in restaurants})
+            checked += 1
+            if results[0] != results[1]:
+                differences += 1
+                print(f"\tscenario {number}, avoiding {avoided}, crowdedness {crowdedness}: {len(results[0])} restaurants in memory, {len(results[1])} in the quadstore")
+                for name in sorted(set(results[0]) ^ set(results[1])):
+                    print(f"\t\t{name} only {'in memory' if name in results[0] else 'in the quadstore'}")
+    print(f"{checked} requests compared, {differences} with different candidates")
+    return differences == 0
+
+
+if __name__ == '__main__':
+    # python quadstore.py store.sqlite3 [ontology.owl]
+    if len(sys.argv) < 2:
+        print("Usage: python quadstore.py store.sqlite3 [ontology.owl]")
+        sys.exit(2)
+    sys.exit(0 if verify(*sys.argv[1:3]) else 1)
@@ -0,0 +1,65 @@
+import threading
+from contextlib import contextmanager
+
+from instrumentation import Stats
+
+DEFAULT_WEIGHTS = {
+    "MAIN_FOOD": 0.5,
+    "MAIN_TRANSPORT": 0.5,
+    "TRANSPORT_CO2": 0.6,
+    "TRANSPORT_COST": 0.3,
+    "TRANSPORT_DURATION": 0.1,
+}
+
+
+class RequestContext:
+    # State of a single recommendation: the weights derived from the preferences, the caches and results of the
+    # request and its instrumentation. The agent only keeps what is shared by every request (the knowledge base),
+    # so any number of requests can run on the same agent at the same time, each one with its own context.
+
+    def __init__(self, output_path="output.json"):
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.stats = Stats()
+        self.score_cache = {}  # food and duration terms shared by the score_options calls of the request
+        self.options = None
+        self.output_path = output_path
+
+
+class SharedLock:
+    # Readers-writer lock: any number of requests read the knowledge base at the same time, a runtime update waits
+    # for them to finish and blocks new ones while it changes it. Waiting writers go first so updates are not starved.
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    @contextmanager
+    def reading(self):
+        with self.condition:
+            while self.writer or self.waiting_writers > 0:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers > 0:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
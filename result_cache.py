@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    # LRU cache of recommendation results with an optional time to live (seconds). The entries belong to one
+    # version of the knowledge base: the first lookup after an update finds a new version and empties the cache.
+    # max_size 0 disables it.
+
+    def __init__(self, max_size=256, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key: (time it was stored, result), least recently used first
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def check_version(self, version):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        with self.lock:
+            self.check_version(version)
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, result):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.check_version(version)
+            self.entries[key] = (time.monotonic(), result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def as_dict(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"size": len(self.entries), "max_size": self.max_size, "ttl": self.ttl, "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total > 0 else 0}
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,78 @@
+import heapq
+import itertools
+import math
+
+# Lengths in the units of Agent.get_duration: walking crosses to an adjacent neighbourhood in 10 and goes to another
+# city in 80, the other transports take their duration (walking has 100) / 100 of that
+NEIGHBOURHOOD_HOP = 10
+CITY_TRIP = 80
+WALKING_DURATION = 100
+# Changes of the knowledge base that change the routes, any other update keeps the router and its shortest paths
+ROUTING_PROPERTIES = {"adjacentTo", "belongsToCity", "administrativeZoneOf", "hasTrainStation", "duration"}
+ROUTING_CLASSES = {"Neighbourhood", "BigCity"}
+
+
+class Router:
+    # Travel times between neighbourhoods for every transport. The graph has the adjacentTo hops and a trip between
+    # any two cities: every departure node leads to one hub, and the hub leads to the arrival node of every city but
+    # the one the trip left, so a trip can not go back into that city. The train only runs between neighbourhoods with a train station (every neighbourhood of a BigCity has
+    # one), the other legs of a train trip are walked. The shortest times from an origin are computed once per
+    # transport (Dijkstra) and kept, so the durations of all the restaurants of a request come from one traversal.
+
+    def __init__(self, kb):
+        self.kb = kb
+        self.cities = sorted({city for city in kb.neighbourhood_city.values() if city is not None})
+        self.graph = self.compute_graph()  # node: [(node, length, both ends have a train station)], without the hub
+        self.trees = {}  # (origin, transport): {neighbourhood: shortest travel time}
+
+    def compute_graph(self):
+        kb = self.kb
+        big_cities = set(kb.instances("BigCity")) if "BigCity" in kb.members else set()
+        stations = {n for n in kb.instances("Neighbourhood") if True in kb.get(n, "hasTrainStation") or kb.neighbourhood_city.get(n) in big_cities}
+        graph = {}
+        for neighbourhood in kb.instances("Neighbourhood"):
+            edges = graph.setdefault(neighbourhood, [])
+            for adjacent in kb.get(neighbourhood, "adjacentTo"):
+                edges.append((adjacent, NEIGHBOURHOOD_HOP, neighbourhood in stations and adjacent in stations))
+            city = kb.neighbourhood_city.get(neighbourhood)
+            if city is not None:
+                edges.append((("departure", city), CITY_TRIP / 2, neighbourhood in stations))
+                graph.setdefault(("arrival", city), []).append((neighbourhood, CITY_TRIP / 2, neighbourhood in stations))
+        return graph
+
+    def factor(self, transport):
+        duration = self.kb.first(transport, "duration") if len(self.kb.get(transport, "duration")) > 0 else WALKING_DURATION
+        return duration / WALKING_DURATION
+
+    def travel_times(self, origin, transport):
+        # {neighbourhood: shortest travel time from origin} for the neighbourhoods the transport can reach
+        key = (origin, transport)
+        if key not in self.trees:
+            self.trees[key] = self.shortest_paths(origin, transport)
+        return self.trees[key]
+
+    def shortest_paths(self, origin, transport):
+        speed = self.factor(transport)
+        walking = speed if self.kb.names[transport] != "train" else 1
+        times = {origin: 0}
+        done = set()
+        departed = []  # cities left through the hub, in the order of their departure nodes
+        order = itertools.count(1)  # nodes are ids or tuples, the heap never compares them
+        heap = [(0, 0, origin)]
+        while heap:
+            time, _, node = heapq.heappop(heap)
+            if node in done: continue
+            done.add(node)
+            edges = self.graph.get(node, ())
+            if isinstance(node, tuple) and node[0] == "departure" and len(departed) < 2:
+                # The hub (length 0): the first city left reaches every other city at its time, the second one only
+                # adds the first city, and any later one arrives nowhere sooner
+                departed.append(node[1])
+                arrivals = [city for city in self.cities if city != node[1]] if len(departed) == 1 else [departed[0]]
+                edges = [(("arrival", city), 0, True) for city in arrivals]
+            for other, length, by_train in edges:
+                other_time = time + length * (speed if by_train else walking)
+                if other_time < times.get(other, math.inf):
+                    times[other] = other_time
+                    heapq.heappush(heap, (other_time, next(order), other))
+        return {node: time for node, time in times.items() if not isinstance(node, tuple)}
@@ -0,0 +1,60 @@
+import json
+import os
+import sqlite3
+
+
+def read_legacy_scenarios(path="scenarios.json"):
+    # The old scenarios.json is column oriented ({"column": {"index": value}}), returns (index, scenario) pairs
+    with open(path, "r") as f:
+        columns = json.load(f)
+    indexes = sorted({int(index) for column in columns.values() for index in column})
+    return [(index, {column: values.get(str(index)) for column, values in columns.items()}) for index in indexes]
+
+
+class ScenarioStore:
+    # Append-only store of the user scenarios, one row per scenario keyed by its number.
+    # Adding a scenario is a single insert and reading one is a primary key lookup.
+    # The first time it is opened the scenarios of the old scenarios.json are copied with the same numbers.
+
+    def __init__(self, path="scenarios.db", legacy_path="scenarios.json"):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS scenarios (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        if legacy_path is not None and os.path.exists(legacy_path) and len(self) == 0:
+            self.migrate(legacy_path)
+
+    def migrate(self, legacy_path):
+        rows = [(index, json.dumps(scenario)) for index, scenario in read_legacy_scenarios(legacy_path)]
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO scenarios (id, data) VALUES (?, ?)", rows)
+
+    def append(self, scenario):
+        with self.connection:
+            cursor = self.connection.execute("INSERT INTO scenarios (id, data) VALUES ((SELECT COALESCE(MAX(id) + 1, 0) FROM scenarios), ?)",
+                (json.dumps({str(key): value for key, value in scenario.items()}),))
+        return cursor.lastrowid
+
+    def get(self, scenario_number):
+        row = self.connection.execute("SELECT data FROM scenarios WHERE id = ?", (scenario_number,)).fetchone()
+        if row is None:
+            raise IndexError(f"No scenario number {scenario_number}")
+        return json.loads(row[0])
+
+    def scenarios(self, start=None, stop=None):
+        # (number, scenario) pairs with start <= number < stop, in order
+        start = 0 if start is None else start
+        stop = -1 if stop is None else stop
+        rows = self.connection.execute("SELECT id, data FROM scenarios WHERE id >= ? AND (? < 0 OR id < ?) ORDER BY id", (start, stop, stop))
+        return [(number, json.loads(data)) for number, data in rows]
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM scenarios").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
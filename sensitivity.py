@@ -0,0 +1,140 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+import agent
+import batch
+from request_context import RequestContext
+from scenario_store import ScenarioStore
+
+# How much the rankings depend on the weights of the utility. The utility terms of every option of every stored
+# scenario are computed once (Agent.option_terms), after that the utility of an option for a weight vector is a dot
+# product of its terms with the weights, and a block of weight vectors is scored for all the options of a scenario
+# at once by broadcasting. The products are taken in the same order as the agent (combine_utility), so the
+# utilities rounded to 2 decimals and their ties are exactly the ones of a real run. Every top n is compared with
+# the one the agent gives with the weights of set_weights.
+
+WEIGHT_NAMES = ["MAIN_FOOD", "MAIN_TRANSPORT", "TRANSPORT_CO2", "TRANSPORT_COST", "TRANSPORT_DURATION"]
+
+
+def utilities(terms, vectors):
+    # (options, vectors) utilities for a list of weight vectors
+    weights = {name: np.array([vector[name] for vector in vectors])[None, :] for name in WEIGHT_NAMES}
+    return agent.combine_utility(weights, terms[:, 0:1], terms[:, 1:2], terms[:, 2:3], terms[:, 3:4])
+
+
+def random_weights(samples, seed=0):
+    # Food against transport uniform, the three transport weights uniform on their simplex like set_weights normalizes them
+    rng = np.random.default_rng(seed)
+    food = rng.random(samples)
+    transport = rng.dirichlet(np.ones(3), samples)
+    return [dict(zip(WEIGHT_NAMES, [f, 1 - f, *t])) for f, t in zip(food.tolist(), transport.tolist())]
+
+
+def grid_weights(steps):
+    # Every weight a multiple of 1 / steps, with food + transport = 1 and the three transport weights adding up to 1
+    result = []
+    for food in range(steps + 1):
+        for co2 in range(steps + 1):
+            for cost in range(steps + 1 - co2):
+                result.append(dict(zip(WEIGHT_NAMES, [food / steps, 1 - food / steps, co2 / steps, cost / steps, (steps - co2 - cost) / steps])))
+    return result
+
+
+def top_n(utility, n):
+    # Positions of the n best options of every column, ties in enumeration order like Agent.rank_options.
+    # Only the options at least as good as the n-th best are sorted.
+    result = []
+    for column in utility.T:
+        candidates = np.arange(len(column))
+        if len(column) > n:
+            threshold = np.partition(column, len(column) - n)[len(column) - n]
+            candidates = np.flatnonzero(column >= threshold)
+        result.append(candidates[np.lexsort((candidates, -column[candidates]))][:n].tolist())
+    return result
+
+
+def scenario_terms(a, scenarios):
+    # (scenario number, utility terms of its options, weights of set_weights) of the scenarios with options
+    result = []
+    for number, preferences in scenarios:
+        context = RequestContext()
+        try:
+            terms = a.option_terms(preferences, context)
+        except (KeyError, ValueError) as e:
+            print(f"Scenario {number} skipped: {e}")
+            continue
+        if len(terms) > 0:
+            result.append((number, terms, context.weights))
+    return result
+
+
+def sweep(entries, vectors, n=5, block_size=512):
+    # Per weight vector, the share of scenarios whose best option changes, whose top n changes (order included)
+    # and the mean share of the baseline top n still in the top n. Per scenario, the share of vectors keeping its best option.
+    best_changed = np.zeros(len(vectors))
+    top_changed = np.zeros(len(vectors))
+    overlap = np.zeros(len(vectors))
+    scenarios = []
+    for number, terms, weights in entries:
+        baseline = top_n(utilities(terms, [weights]), n)[0]
+        kept = 0
+        for start in range(0, len(vectors), block_size):
+            utility = utilities(terms, vectors[start:start + block_size])
+            for j, top in enumerate(top_n(utility, n), start):
+                best_changed[j] += top[0] != baseline[0]
+                top_changed[j] += top != baseline
+                overlap[j] += len(set(top) & set(baseline)) / len(baseline)
+                kept += top[0] == baseline[0]
+        scenarios.append({"scenario": number, "options": len(terms), "weights": weights, "best_kept": round(kept / len(vectors), 4)})
+
+    count = max(len(entries), 1)
+    results = [{"weights": {name: round(value, 4) for name, value in weights.items()}, "best_changed": round(best_changed[j] / count, 4),
+        "top_changed": round(top_changed[j] / count, 4), "top_overlap": round(overlap[j] / count, 4)} for j, weights in enumerate(vectors)]
+    return results, scenarios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sensitivity of the recommendations to the weights of the utility")
+    parser.add_argument("--samples", type=int, default=1000, help="random weight vectors")
+    parser.add_argument("--grid", type=int, help="grid of weight vectors with this many steps per weight, instead of random ones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=5, help="size of the compared rankings")
+    parser.add_argument("--scenarios", default="all", help="'all', 'n' or 'start-stop'")
+    parser.add_argument("--ontology", default="infoiag_project_2021_group1.owl")
+    parser.add_argument("--routing", default="hops", choices=["hops", "transport"])
+    parser.add_argument("--output", default="sensitivity_output.json")
+    args = parser.parse_args()
+
+    start, stop = batch.parse_range(args.scenarios)
+    with ScenarioStore() as store:
+        scenarios = store.scenarios(start, stop)
+    a = agent.Agent(args.ontology, routing=args.routing)
+
+    begin = time.perf_counter()
+    entries = scenario_terms(a, scenarios)
+    terms_time = time.perf_counter() - begin
+    vectors = grid_weights(args.grid) if args.grid else random_weights(args.samples, args.seed)
+    begin = time.perf_counter()
+    results, per_scenario = sweep(entries, vectors, args.top)
+    sweep_time = time.perf_counter() - begin
+
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "scenarios": len(entries), "weight_vectors": len(vectors), "top": args.top,
+        "terms_s": round(terms_time, 4), "sweep_s": round(sweep_time, 4), "per_scenario": per_scenario, "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    print(f"{len(vectors)} weight vectors on {len(entries)} scenarios: terms in {terms_time:.2f}s, sweep in {sweep_time:.2f}s")
+    if results:
+        print(f"Best option changed in {np.mean([r['best_changed'] for r in results]):.1%} of the cases, "
+            f"top {args.top} changed in {np.mean([r['top_changed'] for r in results]):.1%}")
+        print("Weights that change the rankings the most:")
+        for result in sorted(results, key=lambda r: r["top_overlap"])[:5]:
+            print(f"\t{result['weights']}: top {args.top} overlap {result['top_overlap']:.2f}, best option changed in {result['best_changed']:.0%}")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
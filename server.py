@@ -0,0 +1,134 @@
+import json
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import agent
+from request_context import RequestContext
+
+
+class RecommendationServer(ThreadingHTTPServer):
+    # Keeps a single reasoned agent in memory and answers every request with it
+    daemon_threads = True
+
+    def __init__(self, address, agent_instance=None):
+        super().__init__(address, RecommendationHandler)
+        self.agent = agent_instance if agent_instance is not None else agent.Agent()
+        # Requests run concurrently (each one has its own context), updates are serialized so the
+        # stats returned with an update are the ones of that update
+        self.update_lock = threading.Lock()
+
+    def recommend(self, preferences, limit=None):
+        context = RequestContext()
+        options = self.agent.recommend(preferences, top_k=limit, context=context)
+        return {"weights": context.weights, "options": list(options), "stats": context.stats.as_dict()}
+
+    def frontier(self, body, limit=None):
+        # Pareto frontier of the preferences ranked with the weights of the request, or with the "weights" of the body
+        # (any of the keys of RequestContext.weights) so other weights are answered from the cached frontier
+        preferences = dict(body)
+        weights = preferences.pop("weights", None) or {}
+        context = RequestContext()
+        frontier = self.agent.pareto_frontier(preferences, context=context)
+        unknown = sorted(set(weights) - set(context.weights))
+        if unknown:
+            raise ValueError(f"Unknown weights {unknown}")
+        weights = dict(context.weights, **{name: float(value) for name, value in weights.items()})
+        if any(value < 0 for value in weights.values()):
+            raise ValueError("The weights can not be negative")
+        options = self.agent.rank_frontier(frontier, weights)
+        return {"weights": weights, "grid_size": frontier.grid_size, "frontier_size": len(frontier),
+            "options": (options if limit is None else options[:limit]).to_list(), "stats": context.stats.as_dict()}
+
+    def update(self, change):
+        # {"action": "add" | "update" | "remove", "name": ..., "class": ... (add), "values": {...}, "append": false}
+        action = change.get("action", "update")
+        with self.update_lock:
+            if action == "add":
+                self.agent.add_individual(change["name"], change["class"], change.get("values"))
+            elif action == "update":
+                self.agent.update_individual(change["name"], change["values"], change.get("append", False))
+            elif action == "remove":
+                self.agent.remove_individual(change["name"])
+            else:
+                raise ValueError(f"Unknown action {action}")
+            stats = self.agent.stats.as_dict()
+        return {"status": "ok", "stats": stats}
+
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    # POST /recommend with a scenarios.json row (or a list of rows) as body, optional ?limit=n
+    # POST /frontier with a row and optional "weights", the Pareto-optimal options ranked with them, optional ?limit=n
+    # POST /update with a change of the knowledge base (or a list of changes), see RecommendationServer.update
+    # GET /health to check that the server is up, with the hit rate of the result cache
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self.send_json(200, {"status": "ok", "result_cache": self.server.agent.result_cache.as_dict()})
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path not in ("/recommend", "/frontier", "/update"):
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        try:
+            limit = parse_qs(url.query).get("limit")
+            limit = int(limit[0]) if limit else None
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            self.send_json(400, {"error": "The body must be a JSON object or a list of JSON objects"})
+            return
+
+        try:
+            if url.path == "/update":
+                handle = self.server.update
+            elif url.path == "/frontier":
+                handle = lambda body: self.server.frontier(body, limit)
+            else:
+                handle = lambda preferences: self.server.recommend(preferences, limit)
+            if isinstance(payload, list):
+                result = [handle(body) for body in payload]
+            elif isinstance(payload, dict):
+                result = handle(payload)
+            else:
+                raise ValueError("The body must be a JSON object or a list of JSON objects")
+        except KeyError as e:
+            self.send_json(400, {"error": f"Missing {'field' if url.path == '/update' else 'preference'} {e}"})
+            return
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            # Any other error is a bug of the agent, the client still gets an answer and the traceback is logged
+            traceback.print_exc()
+            self.send_json(500, {"error": f"Internal error: {type(e).__name__}: {e}"})
+            return
+
+        self.send_json(200, result)
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=8000, host="127.0.0.1", quadstore_path=None, routing="hops", reasoner="native"):
+    server = RecommendationServer((host, port), agent.Agent(reasoner=reasoner, quadstore=quadstore_path, routing=routing))
+    print(f"Serving recommendations on http://{host}:{port}/recommend")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()